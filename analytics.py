@@ -0,0 +1,219 @@
+from array import array
+from dataclasses import dataclass, field
+
+from keylog import CHAR, MISS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Gaps between keystrokes longer than this, in seconds, are pauses rather than typing.
+MAX_INTERVAL = 2.0
+
+
+# Where a typist's time and mistakes go, per key and per pair of consecutive keys, computed
+# from keylog.KeystrokeLog arrays. Each typed character is an attempt at the key expected there,
+# missed if a MISS follows it. The time since the previous character of the same word is that
+# key's and that bigram's interval. Keys are compared lowercased.
+#
+# With NumPy the logs are aggregated as whole arrays, millions of keystrokes in a fraction of
+# a second. Without it, in a single pass in plain Python.
+
+
+@dataclass
+class KeyStats:
+
+    attempts: int = 0
+    errors: int = 0
+    # Attempts timed from the previous key.
+    timed: int = 0
+    total_interval: float = 0.0
+
+    @property
+    def error_rate(self):
+
+        return self.errors / self.attempts if self.attempts else 0.0
+
+    @property
+    def mean_interval_ms(self):
+
+        return self.total_interval / self.timed * 1000 if self.timed else 0.0
+
+
+@dataclass
+class KeystrokeAnalytics:
+
+    keys: dict = field(default_factory=dict)
+    bigrams: dict = field(default_factory=dict)
+    keystrokes: int = 0
+
+    def slowest_bigrams(self, n=10, min_timed=3):
+
+        timed = [(bigram, stats) for bigram, stats in self.bigrams.items() if stats.timed >= min_timed]
+
+        return sorted(timed, key=lambda item: item[1].mean_interval_ms, reverse=True)[:n]
+
+    def most_missed_keys(self, n=10, min_attempts=5):
+
+        attempted = [(key, stats) for key, stats in self.keys.items()
+                     if stats.attempts >= min_attempts and stats.errors]
+
+        return sorted(attempted, key=lambda item: item[1].error_rate, reverse=True)[:n]
+
+
+def get_key(code):
+
+    # Some characters lowercase to several, the first one stands for the key.
+    return chr(code).lower()[:1]
+
+
+def analyse(logs):
+
+    # logs are (times, kinds, values) as returned by KeystrokeLog.to_bytes(), one per session.
+
+    logs = [log for log in logs if log[1]]
+
+    if numpy is not None:
+        return analyse_arrays(logs)
+
+    return analyse_events(logs)
+
+
+def analyse_arrays(logs):
+
+    if not logs:
+        return KeystrokeAnalytics()
+
+    times = numpy.concatenate([numpy.frombuffer(log[0], dtype=numpy.float64) for log in logs])
+    kinds = numpy.concatenate([numpy.frombuffer(log[1], dtype=numpy.uint8) for log in logs])
+    values = numpy.concatenate([numpy.frombuffer(log[2], dtype=numpy.uint32) for log in logs]).astype(numpy.int64)
+
+    # Words, in the sense of runs of characters timed one from the other: anything but a character
+    # or a miss ends one, and so does the end of a session.
+    breaks = (kinds != CHAR) & (kinds != MISS)
+    session_starts = numpy.cumsum([0] + [len(log[1]) for log in logs[:-1]])
+    breaks[session_starts] = True
+    segments = numpy.cumsum(breaks)
+
+    missed = numpy.zeros(len(kinds), dtype=bool)
+    missed[:-1] = kinds[1:] == MISS
+    # The expected character stands for a missed key, the typed one for the others.
+    expected = values.copy()
+    expected[:-1] = numpy.where(missed[:-1], values[1:], values[:-1])
+
+    chars = numpy.flatnonzero(kinds == CHAR)
+    codes = expected[chars]
+    missed = missed[chars]
+    times = times[chars]
+    segments = segments[chars]
+
+    # Keys, lowercased once per distinct character. Code points are small enough to be
+    # mapped to keys through a lookup table, no sorting needed.
+    unique_codes = numpy.flatnonzero(numpy.bincount(codes))
+    names = sorted({get_key(code) for code in unique_codes.tolist() if code})
+    name_ids = {name: i for i, name in enumerate(names)}
+    table = numpy.zeros(unique_codes[-1] + 1 if len(unique_codes) else 1, dtype=numpy.int64)
+    table[unique_codes] = [name_ids.get(get_key(code), 0) if code else 0 for code in unique_codes.tolist()]
+    key_ids = table[codes]
+    # Characters typed past the end of a word were no attempt at any key.
+    known = codes != 0
+
+    intervals = numpy.diff(times)
+    follows = (segments[1:] == segments[:-1]) & known[1:] & known[:-1]
+    timed = follows & (intervals >= 0) & (intervals <= MAX_INTERVAL)
+
+    analytics = KeystrokeAnalytics(keystrokes=len(chars))
+
+    num_keys = max(len(names), 1)
+    attempts = numpy.bincount(key_ids[known], minlength=num_keys)
+    errors = numpy.bincount(key_ids[known], weights=missed[known], minlength=num_keys)
+    key_timed = numpy.bincount(key_ids[1:][timed], minlength=num_keys)
+    key_intervals = numpy.bincount(key_ids[1:][timed], weights=intervals[timed], minlength=num_keys)
+
+    for i in numpy.flatnonzero(attempts):
+        analytics.keys[names[i]] = KeyStats(int(attempts[i]), int(errors[i]), int(key_timed[i]),
+                                            float(key_intervals[i]))
+
+    # Bigrams as pairs of key ids, there are few enough keys to count every possible pair.
+    pair_ids = key_ids[:-1][follows] * num_keys + key_ids[1:][follows]
+    pair_timed = timed[follows]
+
+    num_pairs = num_keys * num_keys
+    pair_attempts = numpy.bincount(pair_ids, minlength=num_pairs)
+    pair_errors = numpy.bincount(pair_ids, weights=missed[1:][follows], minlength=num_pairs)
+    pair_timed_count = numpy.bincount(pair_ids[pair_timed], minlength=num_pairs)
+    pair_intervals = numpy.bincount(pair_ids[pair_timed], weights=intervals[follows][pair_timed],
+                                    minlength=num_pairs)
+
+    for i in numpy.flatnonzero(pair_attempts).tolist():
+        bigram = names[i // num_keys] + names[i % num_keys]
+        analytics.bigrams[bigram] = KeyStats(int(pair_attempts[i]), int(pair_errors[i]), int(pair_timed_count[i]),
+                                             float(pair_intervals[i]))
+
+    return analytics
+
+
+def analyse_events(logs):
+
+    analytics = KeystrokeAnalytics()
+    keys = {}
+
+    for times, kinds, values in logs:
+
+        times = array('d', times)
+        kinds = array('B', kinds)
+        values = array('I', values)
+
+        previous_key = None
+        previous_time = None
+
+        for i, kind in enumerate(kinds):
+
+            if kind == MISS:
+                continue
+
+            if kind != CHAR:
+                previous_key = None
+                continue
+
+            analytics.keystrokes += 1
+            missed = i + 1 < len(kinds) and kinds[i + 1] == MISS
+            code = values[i + 1] if missed else values[i]
+
+            if not code:
+                previous_key = None
+                continue
+
+            key = keys.get(code)
+            if key is None:
+                key = keys[code] = get_key(code)
+
+            stats = analytics.keys.get(key)
+            if stats is None:
+                stats = analytics.keys[key] = KeyStats()
+
+            stats.attempts += 1
+            stats.errors += missed
+
+            if previous_key is not None:
+
+                bigram = previous_key + key
+                bigram_stats = analytics.bigrams.get(bigram)
+                if bigram_stats is None:
+                    bigram_stats = analytics.bigrams[bigram] = KeyStats()
+
+                bigram_stats.attempts += 1
+                bigram_stats.errors += missed
+
+                interval = times[i] - previous_time
+                if 0 <= interval <= MAX_INTERVAL:
+                    stats.timed += 1
+                    stats.total_interval += interval
+                    bigram_stats.timed += 1
+                    bigram_stats.total_interval += interval
+
+            previous_key = key
+            previous_time = times[i]
+
+    return analytics
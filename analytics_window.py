@@ -0,0 +1,132 @@
+from tkinter import *
+from tkinter import ttk
+
+from analytics import analyse
+from gui import FONT, BACKGROUND_COLOR, CORRECT_COLOR, WARNING_COLOR, WRONG_COLOR
+
+KEYBOARD_ROWS = ('1234567890-', 'qwertyuiop', "asdfghjkl;'", 'zxcvbnm,.')
+# How far each row is shifted right, in keys.
+ROW_OFFSETS = (0, .5, .75, 1.25)
+KEY_SIZE = 44
+KEY_GAP = 4
+# Error rate painted fully red.
+MAX_ERROR_RATE = .15
+UNUSED_KEY_COLOR = '#E0E0E0'
+KEY_FONT = (FONT, 12)
+SMALL_FONT = (FONT, 8)
+LIST_FONT = (FONT, 10)
+# Past sessions analysed for the history view.
+HISTORY_SESSIONS = 500
+# Lines in the slowest bigrams and most missed keys lists.
+LIST_LENGTH = 8
+
+
+def blend(color_a, color_b, amount):
+
+    a = [int(color_a[i:i + 2], 16) for i in (1, 3, 5)]
+    b = [int(color_b[i:i + 2], 16) for i in (1, 3, 5)]
+
+    return '#' + ''.join(f'{round(x + (y - x) * amount):02X}' for x, y in zip(a, b))
+
+
+def get_error_color(error_rate):
+
+    amount = min(1.0, error_rate / MAX_ERROR_RATE)
+
+    if amount < .5:
+        return blend(CORRECT_COLOR, WARNING_COLOR, amount * 2)
+
+    return blend(WARNING_COLOR, WRONG_COLOR, amount * 2 - 1)
+
+
+class AnalyticsWindow(Toplevel):
+
+    # Keyboard heatmap of error rates, with the mean time to reach each key,
+    # the slowest bigrams and the most missed keys, for the last test or the history.
+
+    def __init__(self, master, last_keystrokes, history, language):
+
+        super().__init__(master)
+
+        self.title(f'Key Analytics - {language}')
+        self.resizable(width=False, height=False)
+        self.configure(background=BACKGROUND_COLOR)
+
+        self.last_keystrokes = last_keystrokes
+        self.history = history
+        self.language = language
+        # Analysed on first view.
+        self.history_analytics = None
+
+        self.view = StringVar(value='last' if last_keystrokes else 'history')
+
+        frame = ttk.Frame(self, padding=15)
+        frame.grid(row=0, column=0, sticky=N+W+E+S)
+
+        options = ttk.Frame(frame)
+        options.grid(row=0, column=0, columnspan=2, sticky=W)
+        ttk.Radiobutton(options, text='Last test', variable=self.view, value='last',
+                        command=self.refresh).grid(row=0, column=0, padx=(0, 10))
+        ttk.Radiobutton(options, text=f'Last {HISTORY_SESSIONS} tests', variable=self.view, value='history',
+                        command=self.refresh).grid(row=0, column=1)
+
+        width = round(max(len(keys) + offset for keys, offset in zip(KEYBOARD_ROWS, ROW_OFFSETS))
+                      * (KEY_SIZE + KEY_GAP))
+        height = len(KEYBOARD_ROWS) * (KEY_SIZE + KEY_GAP)
+        self.canvas = Canvas(frame, width=width, height=height, background=BACKGROUND_COLOR, highlightthickness=0)
+        self.canvas.grid(row=1, column=0, columnspan=2, pady=10)
+
+        self.summary_var = StringVar()
+        ttk.Label(frame, textvariable=self.summary_var, font=LIST_FONT).grid(row=2, column=0, columnspan=2, sticky=W)
+        self.bigrams_var = StringVar()
+        ttk.Label(frame, textvariable=self.bigrams_var, font=LIST_FONT, justify=LEFT).grid(row=3, column=0, sticky=N+W)
+        self.missed_var = StringVar()
+        ttk.Label(frame, textvariable=self.missed_var, font=LIST_FONT, justify=LEFT).grid(row=3, column=1, sticky=N+W)
+
+        self.refresh()
+
+    def get_analytics(self):
+
+        if self.view.get() == 'last':
+            return analyse([self.last_keystrokes] if self.last_keystrokes else [])
+
+        if self.history_analytics is None:
+            # Whatever is still being written is included.
+            self.history.flush()
+            self.history_analytics = analyse(self.history.keystroke_logs(self.language, HISTORY_SESSIONS))
+
+        return self.history_analytics
+
+    def refresh(self):
+
+        analytics = self.get_analytics()
+
+        self.draw_keyboard(analytics)
+
+        self.summary_var.set(f'{analytics.keystrokes} keystrokes')
+
+        lines = [f'{bigram}  {stats.mean_interval_ms:4.0f} ms' for bigram, stats in
+                 analytics.slowest_bigrams(LIST_LENGTH)]
+        self.bigrams_var.set('Slowest bigrams\n' + ('\n'.join(lines) or '---'))
+
+        lines = [f'{key}  {stats.error_rate:6.1%}' for key, stats in analytics.most_missed_keys(LIST_LENGTH)]
+        self.missed_var.set('Most missed keys\n' + ('\n'.join(lines) or '---'))
+
+    def draw_keyboard(self, analytics):
+
+        self.canvas.delete('all')
+
+        for row, (keys, offset) in enumerate(zip(KEYBOARD_ROWS, ROW_OFFSETS)):
+            for column, key in enumerate(keys):
+
+                x = (column + offset) * (KEY_SIZE + KEY_GAP)
+                y = row * (KEY_SIZE + KEY_GAP)
+                stats = analytics.keys.get(key)
+
+                color = get_error_color(stats.error_rate) if stats else UNUSED_KEY_COLOR
+                self.canvas.create_rectangle(x, y, x + KEY_SIZE, y + KEY_SIZE, fill=color, outline='')
+                self.canvas.create_text(x + KEY_SIZE / 2, y + KEY_SIZE * .4, text=key, font=KEY_FONT)
+
+                if stats and stats.timed:
+                    self.canvas.create_text(x + KEY_SIZE / 2, y + KEY_SIZE * .8,
+                                            text=f'{stats.mean_interval_ms:.0f}ms', font=SMALL_FONT)
@@ -0,0 +1,77 @@
+import sys
+import time
+import random
+import argparse
+
+from utils import files, get_random_words
+from recording import load_recording, synthesize_keystrokes, replay
+
+
+# Replays recorded or synthetic keystroke streams through the scoring and highlighting path
+# and reports per keystroke latency percentiles and throughput for each language.
+
+
+def percentile(sorted_values, p):
+
+    if not sorted_values:
+        return 0
+
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(language, latencies, elapsed):
+
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    p50 = percentile(latencies, 50) / 1000
+    p99 = percentile(latencies, 99) / 1000
+    worst = latencies[-1] / 1000 if latencies else 0
+    throughput = count / elapsed if elapsed else 0
+
+    print(f'{language:<12} {count:>10} {p50:>9.2f} {p99:>9.2f} {worst:>9.2f} {throughput:>14,.0f}')
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Replay keystroke streams through the scoring path.')
+    parser.add_argument('recordings', nargs='*', help='recording files saved by the GUI')
+    parser.add_argument('--sessions', type=int, default=20,
+                        help='synthetic sessions per language when no recordings are given (default: 20)')
+    parser.add_argument('--words', type=int, default=200, help='words per synthetic session (default: 200)')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='synthetic mistyping rate (default: 0.05)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    streams = {}
+
+    if args.recordings:
+        for filename in args.recordings:
+            language, words, events, case_sensitive = load_recording(filename)
+            streams.setdefault(language, []).append((words, events, case_sensitive))
+
+    else:
+        rng = random.Random(args.seed)
+        random.seed(args.seed)
+        for language in files:
+            for _ in range(args.sessions):
+                words = get_random_words(num=args.words, language=language)
+                streams.setdefault(language, []).append(
+                    (words, synthesize_keystrokes(words, error_rate=args.error_rate, rng=rng), False))
+
+    print(f'{"language":<12} {"keystrokes":>10} {"p50 (us)":>9} {"p99 (us)":>9} {"max (us)":>9} {"keystrokes/s":>14}')
+
+    for language, sessions in streams.items():
+
+        latencies = []
+        start = time.perf_counter()
+
+        for words, events, case_sensitive in sessions:
+            latencies.extend(replay(words, events, case_sensitive=case_sensitive))
+
+        report(language, latencies, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
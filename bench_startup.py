@@ -0,0 +1,65 @@
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+from utils import STARTUP_PROBE_ENV
+
+
+# Reports how long the app takes to import and to show its first frame,
+# each measured in a fresh interpreter.
+
+
+def measure_import_time():
+
+    # Cumulative import time of the gui module, in seconds, from python -X importtime.
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import gui'],
+                             capture_output=True, text=True, check=True)
+
+    for line in process.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| gui$', line)
+        if match:
+            return int(match.group(1)) / 1_000_000
+
+    raise RuntimeError('gui import time not found')
+
+
+def measure_first_frame():
+
+    env = dict(os.environ, **{STARTUP_PROBE_ENV: repr(time.time())})
+    process = subprocess.run([sys.executable, 'main.py'], env=env, capture_output=True, text=True, check=True)
+
+    match = re.search(r'first_frame ([\d.]+)', process.stdout)
+
+    if not match:
+        raise RuntimeError('the app did not report its first frame')
+
+    return float(match.group(1))
+
+
+def report(name, samples):
+
+    print(f'{name:<12} median {statistics.median(samples) * 1000:8.1f} ms'
+          f'  min {min(samples) * 1000:8.1f} ms  max {max(samples) * 1000:8.1f} ms')
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Measure import time and time to first frame.')
+    parser.add_argument('--runs', type=int, default=10, help='runs of each measurement (default: 10)')
+    parser.add_argument('--imports-only', action='store_true', help="skip time to first frame, it needs a display")
+    args = parser.parse_args(argv)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    report('import', [measure_import_time() for _ in range(args.runs)])
+
+    if not args.imports_only:
+        report('first frame', [measure_first_frame() for _ in range(args.runs)])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
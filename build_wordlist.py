@@ -0,0 +1,140 @@
+import os
+import re
+import sys
+import time
+import heapq
+import argparse
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Characters allowed inside a word besides letters, by language code.
+# French keeps elisions and compounds like the shipped list does (d'un, peut-être).
+INNER_CHARACTERS = {
+    'en': '',
+    'br': '',
+    'es': '',
+    'fr': "'-",
+}
+# Text handed to a worker at a time, in characters.
+CHUNK_SIZE = 4 * 1024 * 1024
+# Where chunks may be cut, no word spans them.
+WHITESPACE = ' \t\n\r\f\v'
+
+
+# Builds a frequency word list, in the format of the files in words/, from plain text corpora
+# of any size. Files are streamed in chunks, chunks are counted in parallel and the counts merged.
+
+
+def get_tokenizer(language):
+
+    inner = re.escape(INNER_CHARACTERS.get(language, ''))
+
+    if inner:
+        return re.compile(rf"[^\W\d_]+(?:[{inner}][^\W\d_]+)*")
+
+    return re.compile(r'[^\W\d_]+')
+
+
+def normalise(text):
+
+    text = unicodedata.normalize('NFC', text)
+
+    # Typographic apostrophes are typed as plain ones.
+    return text.replace('’', "'").lower()
+
+
+def count_chunk(language, text, min_length):
+
+    tokenizer = get_tokenizer(language)
+
+    return Counter(word for word in tokenizer.findall(normalise(text)) if len(word) >= min_length)
+
+
+def iter_chunks(paths, chunk_size=CHUNK_SIZE):
+
+    # Streams the corpora in blocks of chunk_size characters, however long their lines are.
+    # A block ends at its last whitespace, the word it would cut in two goes with the next one.
+
+    for path in paths:
+
+        with open(path, encoding='utf-8', errors='replace') as f:
+
+            carry = ''
+
+            while block := f.read(chunk_size):
+
+                text = carry + block
+                cut = max(text.rfind(space) for space in WHITESPACE) + 1
+
+                if cut == 0:
+                    # No space at all. Words up to a chunk long are kept whole, anything longer
+                    # isn't worth holding in memory.
+                    if len(text) <= chunk_size:
+                        carry = text
+                        continue
+                    cut = len(text)
+
+                yield text[:cut]
+                carry = text[cut:]
+
+            if carry:
+                yield carry
+
+
+def count_words(language, paths, jobs, min_length=1):
+
+    totals = Counter()
+    chunks = 0
+
+    with ProcessPoolExecutor(jobs) as executor:
+
+        pending = set()
+
+        for chunk in iter_chunks(paths):
+
+            # Only a couple of chunks per worker are in memory at once.
+            if len(pending) >= jobs * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    totals.update(future.result())
+
+            pending.add(executor.submit(count_chunk, language, chunk, min_length))
+            chunks += 1
+
+        for future in pending:
+            totals.update(future.result())
+
+    return totals, chunks
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Build a frequency word list from plain text corpora.')
+    parser.add_argument('language', help='language code, used for tokenizing and the output file name (e.g. en, fr)')
+    parser.add_argument('corpora', nargs='+', help='UTF-8 plain text files')
+    parser.add_argument('-n', '--top', type=int, default=10000, help='words in the list (default: 10000)')
+    parser.add_argument('--min-length', type=int, default=1, help='shortest word kept (default: 1)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('-o', '--output', help='output file (default: words/common_words_<language>.txt)')
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join('words', f'common_words_{args.language}.txt')
+    start = time.perf_counter()
+
+    totals, chunks = count_words(args.language, args.corpora, args.jobs, args.min_length)
+
+    # Most frequent first, ties in alphabetical order so builds are reproducible.
+    top = heapq.nsmallest(args.top, totals.items(), key=lambda item: (-item[1], item[0]))
+
+    with open(output, 'w', encoding='utf-8') as f:
+        for word, _ in top:
+            f.write(word + '\n')
+
+    print(f'{len(top)} words out of {len(totals)} distinct, from {chunks} chunks in '
+          f'{time.perf_counter() - start:.1f} s -> {output}')
+    print(f"Add it to utils.files as e.g. '<Language name>': '{os.path.basename(output)}'")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import os
+import sys
+import struct
+import argparse
+
+from utils import files, get_true_filename, get_compiled_filename
+from utils import WORD_LIST_MAGIC, WORD_LIST_HEADER
+
+
+# Compiles the plain text word lists into the binary format read by utils.MappedWordList:
+#
+#   header:  magic, format version, word count
+#   offsets: word count + 1 little-endian uint32, word i is blob[offsets[i]:offsets[i + 1]]
+#   blob:    all words encoded as UTF-8, back to back
+
+
+def compile_word_list(source, destination):
+
+    with open(source, encoding='utf-8') as f:
+        words = [word.encode('utf-8') for word in (line.strip() for line in f) if word]
+
+    offsets = [0]
+    for word in words:
+        offsets.append(offsets[-1] + len(word))
+
+    tmp = destination + '.tmp'
+
+    with open(tmp, 'wb') as f:
+        f.write(WORD_LIST_HEADER.pack(WORD_LIST_MAGIC, 1, len(words)))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        for word in words:
+            f.write(word)
+
+    # Never leave a half written file behind for the loader to find.
+    os.replace(tmp, destination)
+
+    return len(words)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Compile the word lists into memory-mappable binary files.')
+    parser.add_argument('languages', nargs='*', default=list(files.keys()),
+                        help='languages to compile (default: all)')
+    args = parser.parse_args(argv)
+
+    for language in args.languages:
+
+        if language not in files:
+            parser.error(f'unknown language: {language}')
+
+        source = get_true_filename(files[language])
+        destination = get_true_filename(get_compiled_filename(files[language]))
+
+        count = compile_word_list(source, destination)
+        print(f'{language}: {count} words -> {destination}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,36 @@
 import io
+import os
+import math
+import time
+import threading
 from tkinter import *
 from tkinter import ttk
 
-from ttkthemes import ThemedTk
-from PIL import Image, ImageTk
+from utils import files, about_messagebox, corpus_cache, get_data_dir, get_true_filename, is_env_flag_set
+from utils import PROFILE_ENV
+from utils import generate_random_words, get_changed_runs
+from session import TypingSession
+from recording import KeystrokeRecorder
+from instrumentation import Instrumentation
 
-from utils import files, about_messagebox
-from utils import get_random_words, get_word_differences, get_correct_typed_characters
-from images import ICON
+# PIL, the embedded icon, the history database, the practice sampler, the passage
+# collections, the race client and the profiler are imported where they're first needed, to get the window up sooner.
 
 # ------------------ CONSTANTS ---------------- #
-TIME_IN_SECONDS = 60
+# Test lengths in seconds, None means the test only ends when the user presses Enter.
+DURATIONS = {
+    '15 s': 15,
+    '30 s': 30,
+    '1 min': 60,
+    '2 min': 120,
+    '5 min': 300,
+    '10 min': 600,
+    'Endless': None,
+}
+DEFAULT_DURATION = '1 min'
+# The timer label and the live stats are refreshed this often, in seconds.
+TICK_INTERVAL = .25
+# How many words are sampled from the corpus at a time.
 NUM_WORDS = 200
 FONT = 'Fira Code'
 TITLE_TEXT_FONT = (FONT, 24)
@@ -26,6 +46,30 @@ CORRECT_TAG = 'correct letter'
 WRONG_TAG = 'wrong letter'
 HIGHLIGHT_TAG = 'highlighted'
 CENTER_TAG = 'center'
+RECORDINGS_DIR = 'recordings'
+# Passages typed in passage mode until another collection is opened, see passages.py.
+PASSAGES_FILE = 'quotes_en.txt'
+# Under the data directory, where passage indexes go when they can't be written next to the collection.
+PASSAGES_CACHE_DIR = 'passages'
+PROFILES_DIR = 'profiles'
+# The Tk callbacks the profiler wraps.
+PROFILED_CALLBACKS = ('revalidate_state', 'flush_updates', 'tick', 'reset_state', 'trigger_end_stats')
+LATENCY_HUD_REFRESH_MS = 500
+# Length of the window of the rolling live stats, in seconds.
+ROLLING_WINDOW = 10
+# The embedded icon, decoded once and cached as PNG which Tk reads without PIL.
+ICON_CACHE_FILENAME = 'icon.png'
+# How often to check whether the first corpus finished loading, in milliseconds.
+LOADING_POLL_MS = 20
+# How often to check for messages from the race server, in milliseconds.
+RACE_POLL_MS = 50
+# Racers shown in the standings.
+RACE_STANDINGS_SHOWN = 5
+TEXT_WIDTH = 45
+TEXT_HEIGHT = 10
+# Lines kept in the text widget around the current one.
+LINES_BEHIND = 1
+LINES_AHEAD = TEXT_HEIGHT + 2
 # --------------------------------------------- #
 
 
@@ -35,12 +79,12 @@ class GUI(ttk.Frame):
 
         super().__init__(master)
 
-        self.master: ThemedTk = master
+        self.master: Tk = master
         self.master.title('Typing Speed Test')
         self.master.resizable(width=False, height=False)
 
-        icon = ImageTk.PhotoImage(Image.open(io.BytesIO(ICON)))
-        self.master.wm_iconphoto(False, icon)
+        # Set once the window is up.
+        self.icon = None
 
         self.grid(row=0, column=0, sticky=N+W+E+S)
         self.configure(padding=30)
@@ -49,22 +93,44 @@ class GUI(ttk.Frame):
 
         self.language = None
         self.language_options = None
-
-        self.words = []
-        self.next_word_start_idx = 0
-        self.user_typed_words = []
-        self.correct_words = 0
-        self.typed_characters = 0
-        self.correctly_typed_characters = 0
-
-        self.last_run_cpm = None
-        self.last_run_ccpm = None
-        self.last_run_wpm = None
-        self.last_run_accuracy = None
+        self.options_panel = None
+        self.duration = None
+        self.duration_options = None
+        self.record_keystrokes = None
+        self.practice_mode = None
+        # Created on demand, by language.
+        self.practice_samplers = {}
+        self.passage_mode = None
+        # Opened on first use, see get_passages().
+        self.passages = None
+        self.passages_file = get_true_filename(PASSAGES_FILE)
+        # Whether the current test is a passage rather than a list of words.
+        self.typing_passage = False
+        # Builds the index of a passage collection used for the first time.
+        self.passages_loader = None
+        # The next test, prepared in the background as (settings, worker thread, [session]),
+        # see prefetch_next_test().
+        self.prefetched = None
+        self.recorder: KeystrokeRecorder | None = None
+
+        self.session: TypingSession | None = None
+        # The text widget only holds the session's lines from this one onwards.
+        self.first_rendered_line = 0
+        self.rendered_lines = 0
+        # Letter states of the current word as currently painted, see utils.get_letter_states.
+        self.letter_states = []
+
+        # Past sessions, the stats of a finished test are compared against the previous one.
+        # Opened on first use, see get_history().
+        self.history = None
+        # The keylog.KeystrokeLog arrays of the last finished test, for the analytics.
+        self.last_keystrokes = None
 
         # This string represents the timer event.
         self.timer = ''
         self.timer_started = False
+        self.start_time = None
+        self.ticks = 0
 
         self.info_panel = None
 
@@ -84,6 +150,32 @@ class GUI(ttk.Frame):
         self.accuracy_label = None
         self.accuracy_diff_var = None
         self.accuracy_diff_label = None
+        self.rolling_var = None
+        self.rolling_label = None
+        self.race_var = None
+        self.race_label = None
+
+        # Set while connected to a race server, see race_client.RaceClient.
+        self.race_client = None
+        # The race being typed, as sent by the server.
+        self.race = None
+        self.race_poll_timer = ''
+        self.latency_hud_var = None
+        self.latency_hud_label = None
+        self.show_latency_hud = None
+
+        # Keystroke handling latencies, by stage.
+        self.instrumentation = Instrumentation()
+        self.latency_hud_timer = ''
+
+        # Widget updates waiting for Tk to be idle, see flush_updates().
+        self.pending_words = []
+        self.pending_letter_states = None
+        self.flush_timer = ''
+        self.flush_keystroke_start = None
+        # Set while profiling, see profiling.Profiler.
+        self.profiler = None
+        self.profiling = None
 
         self.main_label_var = None
         self.title_label = None
@@ -98,7 +190,45 @@ class GUI(ttk.Frame):
 
         self.create_widgets()
         self.register_event_listeners()
-        self.reset_state()
+        self.load_first_corpus()
+        self.after_idle(self.load_icon)
+
+        if self.profiling.get():
+            self.toggle_profiling()
+
+    def load_icon(self):
+
+        cached = os.path.join(get_data_dir(), ICON_CACHE_FILENAME)
+
+        if not os.path.exists(cached):
+            from PIL import Image
+            from images import ICON
+
+            os.makedirs(get_data_dir(), exist_ok=True)
+            Image.open(io.BytesIO(ICON)).save(cached + '.tmp', format='PNG')
+            os.replace(cached + '.tmp', cached)
+
+        self.icon = PhotoImage(file=cached)
+        self.master.wm_iconphoto(False, self.icon)
+
+    def load_first_corpus(self):
+
+        # The word list is read in the background, so the window shows up right away.
+
+        self.main_label_var.set(value='LOADING')
+
+        loader = threading.Thread(target=corpus_cache.get, args=(self.language.get(),), daemon=True)
+        loader.start()
+
+        self.wait_for_first_corpus(loader)
+
+    def wait_for_first_corpus(self, loader):
+
+        if loader.is_alive():
+            self.after(LOADING_POLL_MS, self.wait_for_first_corpus, loader)
+
+        else:
+            self.reset_state()
 
     def create_widgets(self):
 
@@ -107,18 +237,44 @@ class GUI(ttk.Frame):
         self.master.option_add('*tearOff', False)
         file_menu = Menu(my_menu)
         my_menu.add_cascade(label='File', menu=file_menu)
+        view_menu = Menu(my_menu)
+        my_menu.add_cascade(label='View', menu=view_menu)
+        race_menu = Menu(my_menu)
+        my_menu.add_cascade(label='Race', menu=race_menu)
         help_menu = Menu(my_menu)
         my_menu.add_cascade(label='Help', menu=help_menu)
+        self.practice_mode = BooleanVar(value=False)
+        file_menu.add_checkbutton(label='Practice Mode', variable=self.practice_mode, command=self.user_reset)
+        self.passage_mode = BooleanVar(value=False)
+        file_menu.add_checkbutton(label='Passage Mode', variable=self.passage_mode, command=self.user_reset)
+        file_menu.add_command(label='Open Passages...', command=self.open_passages)
+        self.record_keystrokes = BooleanVar(value=False)
+        file_menu.add_checkbutton(label='Record Keystrokes', variable=self.record_keystrokes)
+        file_menu.add_command(label='Export Latency...', command=self.export_latency)
+        self.profiling = BooleanVar(value=is_env_flag_set(PROFILE_ENV))
+        file_menu.add_checkbutton(label='Profiling', variable=self.profiling, command=self.toggle_profiling)
+        file_menu.add_separator()
         file_menu.add_command(label='Quit', command=self.master.quit)
+        self.show_latency_hud = BooleanVar(value=False)
+        view_menu.add_checkbutton(label='Latency HUD', variable=self.show_latency_hud,
+                                  command=self.toggle_latency_hud)
+        view_menu.add_command(label='Key Analytics...', command=self.show_key_analytics)
+        race_menu.add_command(label='Join Race...', command=self.join_race)
+        race_menu.add_command(label='Leave Race', command=self.leave_race)
         help_menu.add_command(label='About', command=about_messagebox)
 
         languages = list(files.keys())
 
         # Setup
+        self.options_panel = ttk.Frame(self)
         self.language = StringVar()
-        self.language_options = ttk.OptionMenu(self, self.language,
+        self.language_options = ttk.OptionMenu(self.options_panel, self.language,
                                                languages[0], *languages,
                                                command=self.language_changed)
+        self.duration = StringVar()
+        self.duration_options = ttk.OptionMenu(self.options_panel, self.duration,
+                                               DEFAULT_DURATION, *DURATIONS.keys(),
+                                               command=self.duration_changed)
 
         self.main_label_var = StringVar()
         self.title_label = ttk.Label(self, textvariable=self.main_label_var)
@@ -140,15 +296,23 @@ class GUI(ttk.Frame):
         self.accuracy_label = ttk.Label(self.info_panel, textvariable=self.accuracy_var)
         self.accuracy_diff_var = StringVar()
         self.accuracy_diff_label = ttk.Label(self.info_panel, textvariable=self.accuracy_diff_var)
+        self.latency_hud_var = StringVar()
+        self.latency_hud_label = ttk.Label(self.info_panel, textvariable=self.latency_hud_var)
+        self.rolling_var = StringVar()
+        self.rolling_label = ttk.Label(self.info_panel, textvariable=self.rolling_var)
+        self.race_var = StringVar()
+        self.race_label = ttk.Label(self.info_panel, textvariable=self.race_var)
 
         self.main_text_area = Text(self)
         self.input_panel = ttk.Frame(self)
         self.entry_val = StringVar()
         self.entry = ttk.Entry(self.input_panel, textvariable=self.entry_val)
-        self.reset_button = ttk.Button(self.input_panel, command=self.reset_state)
+        self.reset_button = ttk.Button(self.input_panel, command=self.user_reset)
 
         # Positioning
+        self.options_panel.grid(row=0, column=0)
         self.language_options.grid(row=0, column=0)
+        self.duration_options.grid(row=0, column=1, padx=(15, 0))
         self.title_label.grid(row=1, column=0)
 
         self.info_panel.grid(row=2, column=0)
@@ -160,6 +324,9 @@ class GUI(ttk.Frame):
         self.wpm_dif_label.grid(row=0, column=5)
         self.accuracy_label.grid(row=0, column=6)
         self.accuracy_diff_label.grid(row=0, column=7)
+        self.latency_hud_label.grid(row=0, column=8)
+        self.rolling_label.grid(row=1, column=0, columnspan=8)
+        self.race_label.grid(row=2, column=0, columnspan=8)
 
         self.main_text_area.grid(row=3, column=0)
         self.input_panel.grid(row=4, column=0)
@@ -173,10 +340,13 @@ class GUI(ttk.Frame):
 
         self.info_panel.grid()
         for i, child in enumerate(self.info_panel.winfo_children()):
-            if i in (2, 4, 6):
+            if i in (2, 4, 6, 8):
                 child.grid(padx=(15, 0))
 
-        self.main_text_area.configure(width=45, height=10, borderwidth=0)
+        # Only shown on demand.
+        self.latency_hud_label.grid_remove()
+
+        self.main_text_area.configure(width=TEXT_WIDTH, height=TEXT_HEIGHT, borderwidth=0)
         self.main_text_area.configure(wrap='word', state='disabled')
         self.input_panel.configure(padding='10')
         self.entry.grid(padx=(10, 0))
@@ -208,188 +378,405 @@ class GUI(ttk.Frame):
     def register_event_listeners(self):
 
         self.update_tracer_id = self.entry_val.trace('w', self.revalidate_state)
-        self.master.bind('<Return>', self.reset_state)
+        self.master.bind('<Return>', self.finish_or_reset)
         # Disable scrolling with mouse.
         self.main_text_area.bind('<MouseWheel>', lambda e: 'break')
 
     def language_changed(self, *args):
 
+        self.user_reset()
+
+    def duration_changed(self, *args):
+
+        self.user_reset()
+
+    def get_duration(self):
+
+        if self.race:
+            return self.race['duration']
+
+        return DURATIONS[self.duration.get()]
+
+    def get_language(self):
+
+        if self.race:
+            return self.race['language']
+
+        return self.language.get()
+
+    def user_reset(self, *args):
+
+        # Resetting during a race means giving up on it.
+        if self.race:
+            self.race = None
+            self.entry.configure(state='normal')
+
         self.reset_state()
 
+    def finish_or_reset(self, *args):
+
+        # Endless tests only end when the user says so.
+        if self.get_duration() is None and self.timer_started:
+            self.trigger_end_stats()
+
+        else:
+            self.user_reset()
+
     def revalidate_state(self, *args):
 
+        # Still loading.
+        if self.session is None:
+            return
+
+        keystroke_start = time.perf_counter_ns()
+
         # Start the timer if it isn't already.
         if not self.timer_started:
             self.timer_started = True
             self.start_timer()
 
-        curr_word = self.get_current_word()
-
-        # The current entry state.
-        user_input = self.entry_val.get().lower()
-        stripped_user_input = user_input.strip()
-
-        # Update word highlighting
-        self.update_current_word_highlighting()
+        user_input = self.entry_val.get()
 
-        # If user pressed the space bar
-        if len(user_input) > 0 and user_input[-1] == ' ':
+        if self.recorder:
+            self.recorder.record(user_input)
 
-            curr_word_start_idx = self.next_word_start_idx
-            curr_word_end_idx = curr_word_start_idx + len(curr_word)
+        result = self.session.update(user_input)
 
-            # If user input has any character other than a space
-            if len(stripped_user_input) > 0:
-                # Append user word to typed words
-                self.user_typed_words.append(user_input)
+        # The text widget is only brought up to date once Tk is idle, see flush_updates(),
+        # so held keys and bursts of input cost a single repaint.
+        self.pending_words.extend(result.committed)
+        if result.letter_states is not None:
+            self.pending_letter_states = result.letter_states
 
-                # Update next word's start index
-                self.next_word_start_idx += len(curr_word) + 1  # +1 is the space in between words.
+        if result.finished:
+            # All words were traversed, resetting also clears the entry and the pending updates.
+            self.trigger_end_stats()
 
+        elif result.clear_input:
             # Clear the entry widget, this means the widget will never hold a white space.
+            # Right away, the next keystroke goes in there.
             self.entry.delete(0, END)
 
-            self.clear_word_highlighting_tags(curr_word_start_idx, curr_word_end_idx)
+        self.instrumentation.record('keystroke', keystroke_start)
 
-            # If the user correctly typed the word
-            if curr_word == stripped_user_input:
-                self.correct_words += 1
-                self.highlight_tag_word_as_completed(curr_word_start_idx, curr_word_end_idx, correct_word=True)
+        if not self.flush_timer and not result.finished:
+            self.flush_keystroke_start = keystroke_start
+            self.flush_timer = self.after_idle(self.flush_updates)
 
-            # User got it wrong.
-            else:
-                self.highlight_tag_word_as_completed(curr_word_start_idx, curr_word_end_idx, correct_word=False)
+    def flush_updates(self):
 
-            # Get how many characters the user got right
-            correct_characters = get_correct_typed_characters(expected=curr_word, actual=stripped_user_input)
-            self.correctly_typed_characters += correct_characters
+        # Paints everything the session went through since the last flush.
 
-            # If this is None, all words were traversed and program should exit.
-            curr_word = self.get_current_word()
+        self.flush_timer = ''
 
-            if curr_word:
-                self.update_current_word_highlighting()
+        # If user completed words by pressing the space bar
+        if self.pending_words:
 
-            else:
-                self.trigger_end_stats()
+            # Move the rendered lines along to keep upcoming words in view.
+            stage_start = time.perf_counter_ns()
+            self.scroll_rendered_lines()
+            self.instrumentation.record('scroll', stage_start)
+
+            stage_start = time.perf_counter_ns()
+            last_rendered_line = self.first_rendered_line + self.rendered_lines
+
+            for word in self.pending_words:
+                # Skip the words that scrolled out of the widget already.
+                if self.first_rendered_line <= word.line < last_rendered_line:
+                    self.clear_word_highlighting_tags(word.line, word.start_idx, word.end_idx)
+                    self.highlight_tag_word_as_completed(word.line, word.start_idx, word.end_idx,
+                                                         correct_word=word.correct)
+
+            self.highlight_current_word()
+            self.instrumentation.record('word_completion', stage_start)
+            self.pending_words = []
+
+        if self.pending_letter_states is not None:
+            stage_start = time.perf_counter_ns()
+            self.update_current_word_highlighting(self.pending_letter_states)
+            self.instrumentation.record('highlight', stage_start)
+            self.pending_letter_states = None
+
+        # Tk repaints in the next idle round, so an idle callback approximates input-to-paint latency.
+        self.after_idle(self.record_paint, self.flush_keystroke_start)
 
-            # Auto-scroll to keep upcoming words in view.
-            next_few_characters = 100
-            self.main_text_area.see(f'1.{curr_word_end_idx + next_few_characters}')
+    def record_paint(self, keystroke_start):
+
+        self.instrumentation.record('paint', keystroke_start)
+
+    def toggle_latency_hud(self):
+
+        if self.show_latency_hud.get():
+            self.latency_hud_label.grid()
+            self.refresh_latency_hud()
 
         else:
-            self.typed_characters += 1
+            self.latency_hud_label.grid_remove()
+            if self.latency_hud_timer:
+                self.after_cancel(self.latency_hud_timer)
+                self.latency_hud_timer = ''
 
-    def get_current_word(self):
+    def refresh_latency_hud(self):
 
-        # The highlighted word the user is currently trying to type.
+        stages = self.instrumentation.stages
+        parts = []
 
-        try:
-            curr_word_idx = len(self.user_typed_words)
-            return self.words[curr_word_idx]
+        for stage, label in (('keystroke', 'KEY'), ('paint', 'PAINT')):
+            if stage in stages:
+                parts.append(f'{label} p99: {stages[stage].percentile(99)}µs')
 
-        except IndexError:
-            # All words were traversed.
-            return None
+        self.latency_hud_var.set('  '.join(parts) or 'LAT: ---')
+        self.latency_hud_timer = self.after(LATENCY_HUD_REFRESH_MS, self.refresh_latency_hud)
 
-    def update_current_word_highlighting(self):
+    def export_latency(self):
 
-        curr_word = self.get_current_word()
-        start = self.next_word_start_idx
-        end = start + len(curr_word)
+        from tkinter import filedialog
 
-        user_input = self.entry_val.get().strip().lower()
-        user_input_len = len(user_input)
+        filename = filedialog.asksaveasfilename(title='Export Latency', defaultextension='.json',
+                                                filetypes=[('JSON', '*.json'), ('CSV', '*.csv')])
 
-        differences = get_word_differences(curr_word, user_input)
+        if filename:
+            self.instrumentation.export(filename)
 
-        # If user inputted more characters than current word has, there's no need to update the highlighting.
-        if user_input_len <= len(differences):
+    def toggle_profiling(self):
 
-            self.clear_word_highlighting_tags(start, end)
+        if self.profiling.get():
+            from profiling import Profiler
 
-            # Normal background highlight
-            self.main_text_area.tag_add(HIGHLIGHT_TAG, f'1.{start}', f'1.{end}')
+            self.profiler = Profiler(self, PROFILED_CALLBACKS)
+            self.profiler.start()
 
-            # self.entry_val.set('')
+        elif self.profiler:
+            self.profiler.stop(PROFILES_DIR)
+            self.profiler = None
 
-            for i in range(user_input_len):
+        # The trace holds on to the callback it was given, swap it for the (un)wrapped one.
+        self.entry_val.trace_vdelete('w', self.update_tracer_id)
+        self.update_tracer_id = self.entry_val.trace('w', self.revalidate_state)
 
-                # Compare the words, letter by letter,
-                # painting that letter green if it's correct,
-                # red if it's wrong.
+    def text_index(self, line, column):
 
-                letter_is_right = not differences[i]
+        # Index in the text widget of a position in the session's layout.
 
-                letter_start_idx = start + i
-                letter_end_idx = letter_start_idx + 1
+        return f'{line - self.first_rendered_line + 1}.{column}'
 
-                if letter_is_right:
-                    self.main_text_area.tag_add(CORRECT_TAG, f'1.{letter_start_idx}', f'1.{letter_end_idx}')
+    def render_lines(self, last_line):
 
-                else:
-                    self.main_text_area.tag_add(WRONG_TAG, f'1.{letter_start_idx}', f'1.{letter_end_idx}')
+        # Appends the session's lines up to last_line to the text widget.
 
-    def clear_word_highlighting_tags(self, start_index, end_index):
+        layout = self.session.layout
+        layout.ensure_lines(last_line + 1)
+        last_line = min(last_line, layout.complete_lines - 1)
+        next_line = self.first_rendered_line + self.rendered_lines
+
+        if next_line > last_line:
+            return
+
+        lines = [layout.line_text(line) for line in range(next_line, last_line + 1)]
+        text = '\n'.join(lines)
+
+        if self.rendered_lines:
+            text = '\n' + text
+
+        # Main text widget is disabled to avoid tampering, need to enable it to modify its contents,
+        # then disable it again.
+        self.main_text_area.configure(state='normal')
+        self.main_text_area.insert(END, text, CENTER_TAG)
+        self.main_text_area.configure(state='disabled')
+
+        self.rendered_lines += len(lines)
+
+    def scroll_rendered_lines(self):
+
+        # Drops the lines that were typed already and appends upcoming ones,
+        # so the widget holds the same few lines however long the test is.
+
+        curr_line, _ = self.session.current_word_position
+
+        first_line = max(0, curr_line - LINES_BEHIND)
+        dropped_lines = first_line - self.first_rendered_line
+
+        if dropped_lines > 0:
+            self.main_text_area.configure(state='normal')
+            self.main_text_area.delete('1.0', f'{dropped_lines + 1}.0')
+            self.main_text_area.configure(state='disabled')
+
+            self.first_rendered_line = first_line
+            self.rendered_lines -= dropped_lines
+
+        self.render_lines(curr_line + LINES_AHEAD)
+
+    def highlight_current_word(self):
+
+        curr_word = self.session.current_word
+        line, start = self.session.current_word_position
+        end = start + len(curr_word)
+
+        # Normal background highlight
+        self.main_text_area.tag_add(HIGHLIGHT_TAG, self.text_index(line, start), self.text_index(line, end))
+
+        # Nothing typed yet.
+        self.letter_states = [None] * len(curr_word)
+
+    def update_current_word_highlighting(self, letter_states):
+
+        # Paints the letters of the current word green if they're correct, red if they're wrong.
+
+        line, start = self.session.current_word_position
+
+        # Only the letters that changed since the last keystroke are retagged,
+        # neighbouring letters with the same new state in a single call.
+        for run_start, run_end, old_states, new_state in get_changed_runs(self.letter_states, letter_states):
+
+            run_start_idx = self.text_index(line, start + run_start)
+            run_end_idx = self.text_index(line, start + run_end)
+
+            for old_state in old_states:
+                if old_state is not None:
+                    self.main_text_area.tag_remove(CORRECT_TAG if old_state else WRONG_TAG, run_start_idx, run_end_idx)
+
+            if new_state is not None:
+                self.main_text_area.tag_add(CORRECT_TAG if new_state else WRONG_TAG, run_start_idx, run_end_idx)
+
+        self.letter_states = letter_states
+
+    def clear_word_highlighting_tags(self, line, start_index, end_index):
         # Clear all tags in between indices.
         for tag in (HIGHLIGHT_TAG, CORRECT_TAG, WRONG_TAG):
-            self.main_text_area.tag_remove(tag, f'1.{start_index}', f'1.{end_index}')
+            self.main_text_area.tag_remove(tag, self.text_index(line, start_index), self.text_index(line, end_index))
 
-    def highlight_tag_word_as_completed(self, start_index, end_index, correct_word=False):
+    def highlight_tag_word_as_completed(self, line, start_index, end_index, correct_word=False):
 
         tag = CORRECT_TAG if correct_word else WRONG_TAG
 
-        self.main_text_area.tag_add(tag, f'1.{start_index}', f'1.{end_index}')
+        self.main_text_area.tag_add(tag, self.text_index(line, start_index), self.text_index(line, end_index))
 
     def start_timer(self):
 
-        self.count_down(TIME_IN_SECONDS)
+        self.start_time = time.monotonic()
+        self.ticks = 0
+        self.tick()
 
-    def count_down(self, count):
+    def get_elapsed_time(self):
 
-        minute = count // 60
-        second = count % 60
+        return time.monotonic() - self.start_time
 
-        self.main_label_var.set(f'Time remaining: {minute:02}:{second:02}')
+    def tick(self):
+
+        # Everything is derived from the monotonic start time, so late callbacks don't add up
+        # and the test ends on time no matter how busy the event loop is.
+
+        elapsed = self.get_elapsed_time()
+        duration = self.get_duration()
+
+        if duration is None:
+            count = int(elapsed)
+            self.main_label_var.set(f'Time elapsed: {count // 60:02}:{count % 60:02}')
+
+        else:
+            remaining = duration - elapsed
+
+            if remaining <= 0:
+                self.trigger_end_stats()
+                return
 
-        if count > 0:
+            count = math.ceil(remaining)
+            self.main_label_var.set(f'Time remaining: {count // 60:02}:{count % 60:02}')
 
-            if count < TIME_IN_SECONDS * .15:
+            if count < duration * .15:
                 self.title_label.configure(foreground=WRONG_COLOR)
 
-            elif count < TIME_IN_SECONDS * .4:
+            elif count < duration * .4:
                 self.title_label.configure(foreground=WARNING_COLOR)
 
-            self.timer = self.master.after(1000, self.count_down, count - 1)
+        self.update_live_stats(elapsed)
 
-        else:
-            self.trigger_end_stats()
+        if self.race and self.race_client:
+            self.race_client.send_progress(self.session.typed_words, self.session.correct_words,
+                                           self.session.typed_characters)
+
+        # Ticks are scheduled on a fixed grid from the start, skipping any that were missed.
+        self.ticks = max(self.ticks + 1, int(elapsed / TICK_INTERVAL) + 1)
+        next_tick = self.ticks * TICK_INTERVAL
+
+        if duration is not None:
+            next_tick = min(next_tick, duration)
+
+        delay = max(0, round((next_tick - self.get_elapsed_time()) * 1000))
+        self.timer = self.master.after(delay, self.tick)
+
+    def update_live_stats(self, elapsed):
+
+        result = self.session.result(elapsed=elapsed, with_words=False)
+
+        self.cpm_var.set(f'CPM: {result.cpm}')
+        self.ccpm_var.set(f'CCPM: {result.ccpm}')
+        self.wpm_var.set(f'WPM: {result.wpm}')
+        self.accuracy_var.set(f'ACC: {result.accuracy}%')
+
+        rolling = self.session.rolling_result()
+        self.rolling_var.set(f'Last {ROLLING_WINDOW}s - CPM: {rolling.cpm}  WPM: {rolling.wpm}  ACC: {rolling.accuracy}%')
 
     def trigger_end_stats(self):
 
+        end_stats_start = time.perf_counter_ns()
+
+        elapsed = self.get_elapsed_time()
+        result = self.session.result(elapsed=elapsed)
+        language = self.get_language()
+        duration = self.get_duration()
+
+        if self.race:
+            if self.race_client:
+                self.race_client.send_progress(self.session.typed_words, self.session.correct_words,
+                                               self.session.typed_characters)
+            # The race is over for this racer, the next test is a normal one.
+            self.race = None
+
+        if self.recorder and self.recorder.events:
+            self.recorder.save(RECORDINGS_DIR)
+
+        if self.profiler:
+            self.profiler.save(PROFILES_DIR)
+
+        # Compare against the previous run in the same language.
+        history = self.get_history()
+        last_runs = history.last_runs(1, language=language)
+        last_run = last_runs[0] if last_runs else None
+
+        from history import SessionRecord
+
+        ended_at = time.time()
+        history.add_session(SessionRecord(
+            language=language, duration=duration, elapsed=elapsed, cpm=result.cpm, ccpm=result.ccpm,
+            wpm=result.wpm, accuracy=result.accuracy, started_at=ended_at - elapsed, ended_at=ended_at,
+            # Words from passages, punctuation and all, aren't the language's word list.
+            word_results=[] if self.typing_passage else result.word_results, keystrokes=self.session.log))
+        self.last_keystrokes = self.session.log.to_bytes()
+
+        # Practice picks up on the words just missed.
+        if language in self.practice_samplers and not self.typing_passage:
+            self.practice_samplers[language].record(result.word_results)
+
         # CPM - Characters per minute.
-        cpm = self.typed_characters
-        last_cpm = self.last_run_cpm
+        cpm = result.cpm
         # Corrected CPM.
-        ccpm = self.correctly_typed_characters
-        last_ccpm = self.last_run_ccpm
+        ccpm = result.ccpm
         # WPM - Words per minute.
-        wpm = self.correct_words
-        last_wpm = self.last_run_wpm
+        wpm = result.wpm
         # Accuracy
-        acc = round(ccpm / cpm * 100, 2)
-        last_run_acc = self.last_run_accuracy
+        acc = result.accuracy
 
         self.cpm_var.set(f'CPM: {cpm}')
         self.ccpm_var.set(f'CCPM: {ccpm}')
         self.wpm_var.set(f'WPM: {wpm}')
         self.accuracy_var.set(f'ACC: {acc}%')
 
-        if last_cpm is not None:
-            dif_cpm = cpm - last_cpm
-            dif_ccpm = ccpm - last_ccpm
-            dif_wpm = wpm - last_wpm
-            dif_acc = round(acc - last_run_acc, 2)
+        if last_run is not None:
+            dif_cpm = cpm - last_run.cpm
+            dif_ccpm = ccpm - last_run.ccpm
+            dif_wpm = wpm - last_run.wpm
+            dif_acc = round(acc - last_run.accuracy, 2)
 
             self.cpm_dif_var.set(f'{"+" if dif_cpm >= 0 else "-"}{abs(dif_cpm)}')
             self.cpm_dif_label.configure(foreground=CORRECT_COLOR if dif_cpm >= 0 else WRONG_COLOR)
@@ -400,27 +787,373 @@ class GUI(ttk.Frame):
             self.accuracy_diff_var.set(f'{"+" if dif_acc >= 0 else "-"}{abs(dif_acc)}%')
             self.accuracy_diff_label.configure(foreground=CORRECT_COLOR if dif_acc >= 0 else WRONG_COLOR)
 
-        self.last_run_cpm = cpm
-        self.last_run_ccpm = ccpm
-        self.last_run_wpm = wpm
-        self.last_run_accuracy = acc
+        else:
+            # First run in this language.
+            for var in (self.cpm_dif_var, self.ccpm_dif_var, self.wpm_dif_var, self.accuracy_diff_var):
+                var.set('')
+
+        self.instrumentation.record('end_stats', end_stats_start)
+
+        self.reset_state()
+
+    def show_key_analytics(self):
+
+        from analytics_window import AnalyticsWindow
+
+        AnalyticsWindow(self.master, self.last_keystrokes, self.get_history(), self.get_language())
+
+    def get_practice_sampler(self, language):
+
+        sampler = self.practice_samplers.get(language)
+
+        if sampler is None:
+            from practice import PracticeSampler
+
+            sampler = self.practice_samplers[language] = PracticeSampler(language, history=self.get_history())
+
+        return sampler
 
+    def get_passages(self):
+
+        if self.passages is None:
+            from passages import PassageCollection
+
+            # Indexes of collections in read-only directories go with the app's caches.
+            self.passages = PassageCollection(self.passages_file,
+                                              cache_dir=os.path.join(get_data_dir(), PASSAGES_CACHE_DIR))
+
+        return self.passages
+
+    def open_passages(self):
+
+        from tkinter import filedialog
+
+        filename = filedialog.askopenfilename(title='Open Passages', filetypes=[('Text', '*.txt'), ('All', '*')])
+
+        if not filename:
+            return
+
+        self.close_passages()
+
+        self.passages_file = filename
+        self.passage_mode.set(True)
+        self.user_reset()
+
+    def close_passages(self):
+
+        # The prefetch worker and the index loader may still be reading the collection,
+        # it's closed once they're done, without waiting for them here.
+
+        passages, self.passages = self.passages, None
+
+        if passages is None:
+            return
+
+        workers = [worker for worker in (self.prefetched[1] if self.prefetched else None, self.passages_loader)
+                   if worker is not None]
+        self.prefetched = None
+
+        def close():
+            for worker in workers:
+                worker.join()
+            passages.close()
+
+        threading.Thread(target=close, name='passages-closer', daemon=True).start()
+
+    def get_history(self):
+
+        if self.history is None:
+            from history import HistoryStore
+
+            self.history = HistoryStore()
+
+        return self.history
+
+    def close(self):
+
+        # Called once the main loop is over.
+        if self.profiler:
+            self.profiler.stop(PROFILES_DIR)
+
+        if self.history is not None:
+            self.history.close()
+
+        if self.passages is not None:
+            self.passages.close()
+
+        if self.race_client:
+            self.race_client.close()
+
+    def join_race(self):
+
+        from tkinter import simpledialog, messagebox
+        from race_client import RaceClient
+        from race_server import DEFAULT_PORT
+
+        address = simpledialog.askstring('Join Race', 'Race server (host:port):',
+                                         initialvalue=f'localhost:{DEFAULT_PORT}', parent=self.master)
+        if not address:
+            return
+
+        name = simpledialog.askstring('Join Race', 'Your name:', parent=self.master)
+        if not name:
+            return
+
+        host, _, port = address.rpartition(':')
+
+        self.leave_race()
+
+        try:
+            self.race_client = RaceClient(host or 'localhost', int(port), name)
+
+        except (OSError, ValueError) as e:
+            messagebox.showerror(title='Join Race', message=f'Could not join the race: {e}')
+            return
+
+        self.race_var.set('Waiting for the next race...')
+        self.poll_race()
+
+    def leave_race(self):
+
+        if self.race_poll_timer:
+            self.after_cancel(self.race_poll_timer)
+            self.race_poll_timer = ''
+
+        if self.race_client:
+            self.race_client.close()
+            self.race_client = None
+            self.race_var.set('')
+
+        if self.race:
+            self.user_reset()
+
+    def poll_race(self):
+
+        for message in self.race_client.poll():
+
+            if message['type'] == 'race':
+                self.prepare_race(message)
+
+            elif message['type'] == 'standings':
+                self.race_var.set(self.format_standings(message['standings'])
+                                  + f'  ({message["racers"]} racing)')
+
+            elif message['type'] == 'end':
+                self.race_var.set('Final: ' + self.format_standings(message['standings']))
+
+            elif message['type'] == 'disconnected':
+                self.leave_race()
+                self.race_var.set('Disconnected from the race server')
+                return
+
+        self.race_poll_timer = self.after(RACE_POLL_MS, self.poll_race)
+
+    def format_standings(self, standings):
+
+        return '  '.join(f'{i}. {name} {correct}'
+                         for i, (name, words, correct) in enumerate(standings[:RACE_STANDINGS_SHOWN], start=1))
+
+    def prepare_race(self, race):
+
+        # Everybody gets the same words, typing is enabled when the race starts.
+        self.race = race
         self.reset_state()
 
+        self.entry.configure(state='disabled')
+        self.main_label_var.set(value=f'Race starts in {race["starts_in"]:.0f}s')
+
+        self.timer = self.master.after(round(race['starts_in'] * 1000), self.start_race)
+
+    def start_race(self):
+
+        self.entry.configure(state='normal')
+        self.entry.focus_set()
+
+        self.timer_started = True
+        self.start_timer()
+
+    def get_next_test_key(self):
+
+        # What the next test is drawn from, None if it can't be prepared ahead of time: race words
+        # come from the server, practice weights change as the test ends, and recordings are timed
+        # from the moment the words are drawn.
+
+        if self.race or self.record_keystrokes.get():
+            return None
+
+        if self.passage_mode.get():
+            return 'passage', self.passages_file
+
+        if self.practice_mode.get():
+            return None
+
+        return 'words', self.language.get()
+
+    def prepare_session(self, key, passages):
+
+        # Runs in the background, so it must not touch Tk.
+
+        kind, source = key
+
+        if kind == 'passage':
+            words = passages.generate_words()
+
+        else:
+            words = generate_random_words(language=source, batch_size=NUM_WORDS)
+
+        session = TypingSession(words, line_width=TEXT_WIDTH, rolling_window=ROLLING_WINDOW,
+                                case_sensitive=kind == 'passage')
+        # Everything the first render needs is drawn and laid out already.
+        session.layout.ensure_lines(LINES_AHEAD + 1)
+
+        return session
+
+    def prefetch_next_test(self):
+
+        # Prepares the next test while this one is typed, so resetting only has to swap it in.
+
+        key = self.get_next_test_key()
+
+        if key is None:
+            self.prefetched = None
+            return
+
+        # Opened here rather than in the background, it's kept for good.
+        passages = self.get_passages() if key[0] == 'passage' else None
+        result = []
+
+        worker = threading.Thread(target=lambda: result.append(self.prepare_session(key, passages)),
+                                  name='prefetch', daemon=True)
+        worker.start()
+
+        self.prefetched = key, worker, result
+
+    def take_prefetched_session(self, key):
+
+        # The prepared session if it matches the settings, None if the next one must be drawn now.
+
+        prefetched, self.prefetched = self.prefetched, None
+
+        if key is None or prefetched is None or prefetched[0] != key:
+            return None
+
+        _, worker, result = prefetched
+
+        # Normally done long ago, otherwise drawing the test now beats waiting for it.
+        if worker.is_alive():
+            return None
+
+        return result[0] if result else None
+
+    def load_passages(self):
+
+        # The first use of a collection builds its index, which takes a while for big ones,
+        # so it's done in the background like loading the first corpus.
+
+        if self.timer:
+            self.master.after_cancel(self.timer)
+            self.timer = ''
+        if self.flush_timer:
+            self.after_cancel(self.flush_timer)
+            self.flush_timer = ''
+
+        # Input is ignored until the passages are ready.
+        self.session = None
+        self.timer_started = False
+        self.main_label_var.set(value='LOADING')
+
+        # Resetting again meanwhile keeps waiting for the same index.
+        if self.passages_loader is not None and self.passages_loader.is_alive():
+            return
+
+        passages = self.get_passages()
+
+        self.passages_loader = threading.Thread(target=passages.get_index, name='passages-loader', daemon=True)
+        self.passages_loader.start()
+
+        self.wait_for_passages(self.passages_loader, passages)
+
+    def wait_for_passages(self, loader, passages):
+
+        if loader.is_alive():
+            self.after(LOADING_POLL_MS, self.wait_for_passages, loader, passages)
+
+        elif passages is not self.passages:
+            # Another collection was opened meanwhile, it's loaded on its own.
+            pass
+
+        elif not passages.quick:
+            # Without an index every pick is a pass over the whole collection, too slow for a reset.
+            self.passages_failed(f'Could not read or index passages from {self.passages_file}.')
+
+        else:
+            self.reset_state()
+
+    def passages_failed(self, message):
+
+        from tkinter import messagebox
+
+        # Back to random words.
+        self.passage_mode.set(False)
+        self.reset_state()
+
+        messagebox.showwarning(title='Passage Mode', message=message, parent=self.master)
+
     def reset_state(self, *args):
 
-        language = self.language.get()
+        language = self.get_language()
+        key = self.get_next_test_key()
+
+        if self.passage_mode.get() and not self.race and not self.get_passages().quick:
+            self.load_passages()
+            return
+
+        session = self.take_prefetched_session(key)
+        self.typing_passage = not self.race and self.passage_mode.get()
+
+        # Words are drawn lazily, as the text area needs them.
+        if session is not None:
+            words = None
+
+        elif self.race:
+            words = iter(self.race['words'])
 
-        words = get_random_words(num=NUM_WORDS, language=language)
+        elif self.passage_mode.get():
+            words = self.get_passages().generate_words()
+
+        elif self.practice_mode.get():
+            words = self.get_practice_sampler(language).generate()
+
+        else:
+            words = generate_random_words(language=language, batch_size=NUM_WORDS)
 
         if self.timer:
             # Cancel timer
             self.master.after_cancel(self.timer)
 
-        self.correct_words = 0
-        self.typed_characters = 0
-        self.correctly_typed_characters = 0
-        self.next_word_start_idx = 0
+        # Everything is repainted below.
+        if self.flush_timer:
+            self.after_cancel(self.flush_timer)
+            self.flush_timer = ''
+        self.pending_words = []
+        self.pending_letter_states = None
+
+        self.recorder = None
+        if self.record_keystrokes.get():
+            self.recorder = KeystrokeRecorder(language, case_sensitive=self.typing_passage)
+            words = self.recorder.track(words)
+
+        if session is None:
+            # Passages are typed as written, capitals and all.
+            session = TypingSession(words, line_width=TEXT_WIDTH, rolling_window=ROLLING_WINDOW,
+                                    case_sensitive=self.typing_passage)
+
+        if self.typing_passage and session.current_word is None:
+            self.passages_failed(f'There are no passages in {self.passages_file}.')
+            return
+
+        self.session = session
+        self.rolling_var.set('')
         self.main_label_var.set(value='READY')
         self.title_label.configure(foreground=CORRECT_COLOR)
         self.timer_started = False
@@ -430,14 +1163,15 @@ class GUI(ttk.Frame):
         self.entry_val.set('')
         self.update_tracer_id = self.entry_val.trace('w', self.revalidate_state)
 
-        # Main text widget is disabled to avoid tampering, need to enable it to modify its contents,
-        # then disable it again.
         self.main_text_area.configure(state='normal')
         self.main_text_area.delete('1.0', END)
-        self.main_text_area.insert(INSERT, ' '.join(words), CENTER_TAG)
         self.main_text_area.configure(state='disabled')
 
-        self.words = words
-        self.user_typed_words = []
-        self.update_current_word_highlighting()
+        self.first_rendered_line = 0
+        self.rendered_lines = 0
+        self.render_lines(LINES_AHEAD)
+
+        self.highlight_current_word()
         self.entry.focus_set()
+
+        self.prefetch_next_test()
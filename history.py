@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+from utils import get_data_dir
+
+# Sessions written in a single transaction, at most.
+BATCH_SIZE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    language TEXT NOT NULL,
+    duration REAL,
+    elapsed REAL NOT NULL,
+    cpm INTEGER NOT NULL,
+    ccpm INTEGER NOT NULL,
+    wpm INTEGER NOT NULL,
+    accuracy REAL NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_ended_at ON sessions (ended_at);
+-- Covers the trend query.
+CREATE INDEX IF NOT EXISTS sessions_language_ended_at ON sessions (language, ended_at, wpm, accuracy);
+CREATE INDEX IF NOT EXISTS sessions_language_wpm ON sessions (language, wpm);
+
+CREATE TABLE IF NOT EXISTS word_results (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    word_index INTEGER NOT NULL,
+    expected TEXT NOT NULL,
+    typed TEXT NOT NULL,
+    correct INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS word_results_session ON word_results (session_id);
+CREATE INDEX IF NOT EXISTS word_results_expected ON word_results (expected);
+
+-- A session's keylog.KeystrokeLog, as its raw arrays.
+CREATE TABLE IF NOT EXISTS keystrokes (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions (id),
+    times BLOB NOT NULL,
+    kinds BLOB NOT NULL,
+    event_values BLOB NOT NULL
+);
+"""
+
+SESSION_COLUMNS = 'id, language, duration, elapsed, cpm, ccpm, wpm, accuracy, started_at, ended_at'
+
+
+@dataclass
+class SessionRecord:
+
+    language: str
+    # Selected length of the test in seconds, None for endless tests.
+    duration: float | None
+    elapsed: float
+    cpm: int
+    ccpm: int
+    wpm: int
+    accuracy: float
+    # Wall clock timestamps.
+    started_at: float
+    ended_at: float
+    word_results: list = field(default_factory=list)
+    # The session's keylog.KeystrokeLog, for analytics.
+    keystrokes: object = None
+    id: int | None = None
+
+
+def get_history_filename():
+
+    filename = os.environ.get('TYPING_TEST_HISTORY')
+
+    if filename:
+        return filename
+
+    return os.path.join(get_data_dir(), 'history.sqlite3')
+
+
+def connect(filename):
+
+    connection = sqlite3.connect(filename, check_same_thread=False)
+    # Lets the UI read while the writer thread is writing.
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+    return connection
+
+
+class HistoryStore:
+
+    # Persistent record of past sessions.
+    #
+    # Writes are queued and done in batches by a background thread, so finishing
+    # a test never waits on the disk. Queries run on the caller's thread.
+
+    def __init__(self, filename=None, store_words=True):
+
+        self.filename = filename or get_history_filename()
+        self.store_words = store_words
+
+        if self.filename != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+
+        self.connection = connect(self.filename)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name='history-writer', daemon=True)
+        self.writer.start()
+
+    def add_session(self, record: SessionRecord):
+
+        self.queue.put(record)
+
+    def flush(self):
+
+        # Blocks until everything queued so far was written.
+
+        self.queue.join()
+
+    def close(self):
+
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.close()
+
+    def write_loop(self):
+
+        # The writer thread has its own connection.
+        connection = self.connection if self.filename == ':memory:' else connect(self.filename)
+
+        while True:
+
+            batch = [self.queue.get()]
+
+            # Whatever else is waiting goes into the same transaction.
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not None]
+
+            try:
+                if records:
+                    self.write(connection, records)
+
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            if len(records) < len(batch):
+                # Closing.
+                break
+
+        if connection is not self.connection:
+            connection.close()
+
+    def write(self, connection, records):
+
+        with connection:
+
+            for record in records:
+
+                cursor = connection.execute(
+                    'INSERT INTO sessions (language, duration, elapsed, cpm, ccpm, wpm, accuracy, started_at, ended_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (record.language, record.duration, record.elapsed, record.cpm, record.ccpm, record.wpm,
+                     record.accuracy, record.started_at, record.ended_at))
+                record.id = cursor.lastrowid
+
+                if self.store_words and record.word_results:
+                    connection.executemany(
+                        'INSERT INTO word_results (session_id, word_index, expected, typed, correct)'
+                        ' VALUES (?, ?, ?, ?, ?)',
+                        [(record.id, word.index, word.expected, word.typed, int(word.correct))
+                         for word in record.word_results])
+
+                if self.store_words and record.keystrokes is not None and len(record.keystrokes):
+                    connection.execute(
+                        'INSERT INTO keystrokes (session_id, times, kinds, event_values) VALUES (?, ?, ?, ?)',
+                        (record.id, *record.keystrokes.to_bytes()))
+
+    def query_sessions(self, sql, parameters=()):
+
+        rows = self.connection.execute(f'SELECT {SESSION_COLUMNS} FROM sessions {sql}', parameters).fetchall()
+
+        return [SessionRecord(id=row[0], language=row[1], duration=row[2], elapsed=row[3], cpm=row[4], ccpm=row[5],
+                              wpm=row[6], accuracy=row[7], started_at=row[8], ended_at=row[9]) for row in rows]
+
+    def last_runs(self, n=10, language=None):
+
+        if language is None:
+            return self.query_sessions('ORDER BY ended_at DESC LIMIT ?', (n,))
+
+        return self.query_sessions('WHERE language = ? ORDER BY ended_at DESC LIMIT ?', (language, n))
+
+    def personal_best(self, language):
+
+        best = self.query_sessions('WHERE language = ? ORDER BY wpm DESC LIMIT 1', (language,))
+
+        return best[0] if best else None
+
+    def word_outcomes(self, language, sessions=500):
+
+        # (expected, typed, correct) of every word typed in the latest sessions of a language.
+
+        return self.connection.execute(
+            'SELECT w.expected, w.typed, w.correct FROM word_results w'
+            ' JOIN (SELECT id FROM sessions WHERE language = ? ORDER BY ended_at DESC LIMIT ?) s'
+            ' ON w.session_id = s.id',
+            (language, sessions)).fetchall()
+
+    def keystroke_logs(self, language, sessions=500):
+
+        # (times, kinds, values) arrays as bytes, see keylog.KeystrokeLog.to_bytes(),
+        # of the latest sessions of a language, oldest first.
+
+        return self.connection.execute(
+            'SELECT k.times, k.kinds, k.event_values FROM keystrokes k'
+            ' JOIN (SELECT id, ended_at FROM sessions WHERE language = ? ORDER BY ended_at DESC LIMIT ?) s'
+            ' ON k.session_id = s.id ORDER BY s.ended_at',
+            (language, sessions)).fetchall()
+
+    def trend(self, language, days=30):
+
+        # Average WPM and accuracy per day over the last few days, as (day start, wpm, accuracy, sessions).
+
+        since = time.time() - days * 86400
+
+        rows = self.connection.execute(
+            'SELECT CAST(ended_at / 86400 AS INTEGER) AS day, AVG(wpm), AVG(accuracy), COUNT(*) FROM sessions'
+            ' WHERE language = ? AND ended_at >= ? GROUP BY day ORDER BY day',
+            (language, since)).fetchall()
+
+        return [(day * 86400, wpm, accuracy, count) for day, wpm, accuracy, count in rows]
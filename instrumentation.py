@@ -0,0 +1,120 @@
+import csv
+import json
+import time
+from collections import deque
+
+# Bucket i holds the samples of up to 2 ** i microseconds, the last one everything slower.
+NUM_BUCKETS = 24
+# How many of the latest samples the rolling histograms cover.
+WINDOW_SIZE = 2048
+
+
+def get_bucket(ns):
+
+    return min(NUM_BUCKETS - 1, max(0, (ns // 1000)).bit_length())
+
+
+class LatencyHistogram:
+
+    # Log2 bucketed histogram over the latest WINDOW_SIZE samples.
+    # Memory stays bounded however long the app runs.
+
+    def __init__(self, window_size=WINDOW_SIZE):
+
+        self.buckets = [0] * NUM_BUCKETS
+        self.window = deque(maxlen=window_size)
+        self.total_count = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+
+        if len(self.window) == self.window.maxlen:
+            # The oldest sample leaves the window.
+            self.buckets[get_bucket(self.window[0])] -= 1
+
+        self.window.append(ns)
+        self.buckets[get_bucket(ns)] += 1
+        self.total_count += 1
+
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def __len__(self):
+
+        return len(self.window)
+
+    def percentile(self, p):
+
+        # Upper bound of the bucket holding the p-th percentile, in microseconds.
+
+        if not self.window:
+            return 0
+
+        rank = p / 100 * len(self.window)
+        seen = 0
+
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return 2 ** i
+
+        return 2 ** (NUM_BUCKETS - 1)
+
+    def summary(self):
+
+        return {
+            'count': self.total_count,
+            'window': len(self.window),
+            'p50_us': self.percentile(50),
+            'p99_us': self.percentile(99),
+            'window_max_us': round(max(self.window) / 1000, 1) if self.window else 0,
+            'max_us': round(self.max_ns / 1000, 1),
+            'buckets': list(self.buckets),
+        }
+
+
+class Instrumentation:
+
+    # Per stage latency histograms, fed with time.perf_counter_ns() deltas:
+    #
+    #   start = time.perf_counter_ns()
+    #   ...
+    #   instrumentation.record('stage', start)
+
+    def __init__(self):
+
+        self.stages = {}
+
+    def record(self, stage, start_ns):
+
+        histogram = self.stages.get(stage)
+
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+
+        histogram.record(time.perf_counter_ns() - start_ns)
+
+    def summary(self):
+
+        return {stage: histogram.summary() for stage, histogram in self.stages.items()}
+
+    def export(self, filename):
+
+        # Exports as CSV if the file name says so, JSON otherwise.
+
+        summary = self.summary()
+
+        if filename.lower().endswith('.csv'):
+
+            with open(filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'count', 'window', 'p50_us', 'p99_us', 'window_max_us', 'max_us']
+                                + [f'le_{2 ** i}us' for i in range(NUM_BUCKETS)])
+                for stage, stats in summary.items():
+                    writer.writerow([stage, stats['count'], stats['window'], stats['p50_us'], stats['p99_us'],
+                                     stats['window_max_us'], stats['max_us']] + stats['buckets'])
+
+        else:
+
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
@@ -0,0 +1,100 @@
+from array import array
+
+# Kinds of events, the meaning of an event's value depends on it.
+CHAR = 0            # A typed character, value is its code point.
+BACKSPACE = 1       # Characters deleted, value is how many.
+PASTE = 2           # Several characters inserted at once, value is how many.
+COMMIT_CORRECT = 3  # A word completed correctly, value is its correctly typed characters.
+COMMIT_WRONG = 4    # A word completed wrong, value is its correctly typed characters.
+MISS = 5            # The character just typed isn't the one expected there, value is the expected
+                    # one's code point, 0 if it went past the end of the word.
+OMIT = 6            # Letters of the word just completed that were left out, value is how many.
+
+
+class KeystrokeLog:
+
+    # Every input event of a session as fixed width records in parallel arrays
+    # (8 byte timestamp, 1 byte kind, 4 byte value), with running totals so
+    # metrics never need a pass over the whole log.
+
+    def __init__(self):
+
+        self.times = array('d')
+        self.kinds = array('B')
+        self.values = array('I')
+
+        self.characters = 0
+        self.backspaces = 0
+        self.pasted_characters = 0
+        self.words = 0
+        self.correct_words = 0
+        self.correct_characters = 0
+        self.misses = 0
+        self.omitted_characters = 0
+
+    def __len__(self):
+
+        return len(self.kinds)
+
+    def append(self, t, kind, value):
+
+        self.times.append(t)
+        self.kinds.append(kind)
+        self.values.append(value)
+
+        if kind == CHAR:
+            self.characters += 1
+
+        elif kind == BACKSPACE:
+            self.backspaces += value
+
+        elif kind == PASTE:
+            self.pasted_characters += value
+
+        elif kind == MISS:
+            self.misses += 1
+
+        elif kind == OMIT:
+            self.omitted_characters += value
+
+        else:
+            self.words += 1
+            self.correct_characters += value
+            if kind == COMMIT_CORRECT:
+                self.correct_words += 1
+
+    def log_input_change(self, t, previous, current):
+
+        # Logs what turned the previous contents of the input into the current ones.
+
+        common = 0
+        limit = min(len(previous), len(current))
+
+        while common < limit and previous[common] == current[common]:
+            common += 1
+
+        deleted = len(previous) - common
+        inserted = len(current) - common
+
+        if deleted:
+            self.append(t, BACKSPACE, deleted)
+
+        if inserted == 1:
+            self.append(t, CHAR, ord(current[common]))
+
+        elif inserted > 1:
+            self.append(t, PASTE, inserted)
+
+    def to_bytes(self):
+
+        return self.times.tobytes(), self.kinds.tobytes(), self.values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, times, kinds, values):
+
+        log = cls()
+
+        for t, kind, value in zip(array('d', times), array('B', kinds), array('I', values)):
+            log.append(t, kind, value)
+
+        return log
@@ -1,12 +1,29 @@
+import os
+import time
+
 from ttkthemes import ThemedTk
 
 from gui import GUI
+from utils import STARTUP_PROBE_ENV
+
+
+def report_first_frame(window, launched_at):
+
+    # Idle callbacks run once the pending drawing is done, so this is the first frame.
+    print(f'first_frame {time.time() - launched_at:.6f}', flush=True)
+    window.destroy()
 
 
 def main():
     window = ThemedTk(theme='breeze')
-    GUI(window)
+    gui = GUI(window)
+
+    launched_at = os.environ.get(STARTUP_PROBE_ENV)
+    if launched_at:
+        window.after_idle(report_first_frame, window, float(launched_at))
+
     window.mainloop()
+    gui.close()
 
 
 if __name__ == '__main__':
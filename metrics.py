@@ -0,0 +1,77 @@
+# What a RollingWindow counts.
+CHARACTERS = 0
+CORRECT_CHARACTERS = 1
+CORRECT_WORDS = 2
+# Letters of completed words that were left out.
+OMITTED_CHARACTERS = 3
+NUM_COUNTERS = 4
+
+
+class RollingWindow:
+
+    # Counts over the last `window` seconds, kept in a ring of fixed size time buckets.
+    # Adding is O(1) and memory is bounded no matter how long the session runs.
+
+    def __init__(self, window=10.0, resolution=.25):
+
+        self.window = window
+        self.resolution = resolution
+        self.size = max(1, round(window / resolution))
+
+        self.buckets = [[0] * self.size for _ in range(NUM_COUNTERS)]
+        self.totals = [0] * NUM_COUNTERS
+
+        # Absolute number of the newest bucket, and when the first event happened.
+        self.current = None
+        self.start = None
+
+    def advance(self, now):
+
+        bucket = int(now / self.resolution)
+
+        if self.current is None:
+            self.current = bucket
+            self.start = now
+            return
+
+        steps = bucket - self.current
+
+        if steps <= 0:
+            return
+
+        # Empty the buckets that fell out of the window, at most one lap around the ring.
+        for b in range(self.current + 1, self.current + 1 + min(steps, self.size)):
+            i = b % self.size
+            for counter in range(NUM_COUNTERS):
+                self.totals[counter] -= self.buckets[counter][i]
+                self.buckets[counter][i] = 0
+
+        self.current = bucket
+
+    def add(self, now, counter, amount=1):
+
+        self.advance(now)
+
+        self.buckets[counter][self.current % self.size] += amount
+        self.totals[counter] += amount
+
+    def rates(self, now):
+
+        # Per minute rates and accuracy over the window, or over the time since the first event
+        # when that's shorter. Returns (cpm, ccpm, wpm, accuracy).
+
+        if self.current is None:
+            return 0, 0, 0, 0.0
+
+        self.advance(now)
+
+        minutes = max(min(self.window, now - self.start), self.resolution) / 60
+        characters, correct_characters, correct_words, omitted_characters = self.totals
+
+        # Left out letters count as errors, as they would have been typed.
+        attempted = characters + omitted_characters
+        accuracy = round(correct_characters / attempted * 100, 2) if attempted else 0.0
+        net_correct_characters = max(0, correct_characters - omitted_characters)
+
+        return (round(characters / minutes), round(net_correct_characters / minutes),
+                round(correct_words / minutes), accuracy)
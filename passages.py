@@ -0,0 +1,287 @@
+import os
+import sys
+import mmap
+import random
+import struct
+import hashlib
+import argparse
+from array import array
+from collections.abc import Sequence
+
+# Passage index format:
+#
+#   header:  magic, format version, passage count, size of the collection it was built from
+#   offsets: passage count pairs of little-endian uint64, passage i is collection[start:end]
+PASSAGE_INDEX_MAGIC = b'TSTP'
+PASSAGE_INDEX_HEADER = struct.Struct('<4sIQQ')
+PASSAGE_INDEX_OFFSETS = struct.Struct('<QQ')
+# Offsets written to the index at a time while building it.
+INDEX_BATCH_SIZE = 65536
+
+
+# A passage collection is a plain UTF-8 text file of any size, quotes, prose or code,
+# with passages separated by blank lines. Passages are picked at random in constant time
+# through an offset index, built once next to the collection, or in a cache directory where the
+# collection's own isn't writable, and read with a single seek. Where the index can't be written
+# at all, they're picked by reservoir sampling over the file instead.
+
+
+def get_index_filename(filename):
+
+    return os.path.splitext(filename)[0] + '.idx'
+
+
+def get_cached_index_filename(filename, cache_dir):
+
+    # Collections of the same name in different directories get their own index.
+    digest = hashlib.sha1(os.path.abspath(filename).encode('utf-8', errors='surrogateescape')).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(filename))[0]
+
+    return os.path.join(cache_dir, f'{name}-{digest}.idx')
+
+
+def iter_passage_offsets(f):
+
+    # (start, end) byte offsets of the passages in a binary file, streamed line by line.
+
+    start = end = None
+    position = 0
+
+    for line in f:
+
+        if line.strip():
+            if start is None:
+                start = position
+            end = position + len(line.rstrip(b'\r\n'))
+
+        elif start is not None:
+            yield start, end
+            start = None
+
+        position += len(line)
+
+    if start is not None:
+        yield start, end
+
+
+def build_passage_index(filename, destination=None):
+
+    destination = destination or get_index_filename(filename)
+    tmp = destination + '.tmp'
+    count = 0
+
+    with open(filename, 'rb') as source, open(tmp, 'wb') as f:
+
+        # The count is only known at the end.
+        f.write(PASSAGE_INDEX_HEADER.pack(PASSAGE_INDEX_MAGIC, 1, 0, 0))
+        batch = array('Q')
+
+        for start, end in iter_passage_offsets(source):
+            batch.append(start)
+            batch.append(end)
+            count += 1
+
+            if len(batch) >= INDEX_BATCH_SIZE:
+                f.write(batch.tobytes())
+                del batch[:]
+
+        f.write(batch.tobytes())
+        f.seek(0)
+        f.write(PASSAGE_INDEX_HEADER.pack(PASSAGE_INDEX_MAGIC, 1, count, os.fstat(source.fileno()).st_size))
+
+    # Never leave a half written file behind for the loader to find.
+    try:
+        os.replace(tmp, destination)
+
+    except OSError:
+        os.remove(tmp)
+        raise
+
+    return count
+
+
+class PassageIndex(Sequence):
+
+    # The offsets of a collection's passages, memory-mapped so opening it costs the same
+    # however many passages there are.
+
+    def __init__(self, filename):
+
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, source_size = PASSAGE_INDEX_HEADER.unpack_from(self.data, 0)
+
+        if magic != PASSAGE_INDEX_MAGIC or version != 1:
+            self.data.close()
+            raise ValueError(f'{filename} is not a passage index')
+
+        self.count = count
+        self.source_size = source_size
+
+    def __len__(self):
+
+        return self.count
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+
+        if index < 0:
+            index += self.count
+
+        if not 0 <= index < self.count:
+            raise IndexError('passage index out of range')
+
+        return PASSAGE_INDEX_OFFSETS.unpack_from(self.data, PASSAGE_INDEX_HEADER.size
+                                                 + index * PASSAGE_INDEX_OFFSETS.size)
+
+    def close(self):
+
+        self.data.close()
+
+
+def open_passage_index(index_filename, filename):
+
+    # The index if it's there and up to date, None otherwise.
+
+    try:
+        if os.path.getmtime(index_filename) < os.path.getmtime(filename):
+            return None
+        index = PassageIndex(index_filename)
+
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if index.source_size == os.path.getsize(filename):
+        return index
+
+    index.close()
+
+    return None
+
+
+def load_passage_index(filename, cache_dir=None):
+
+    # The collection's index, built if it's missing or out of date, next to the collection
+    # or else in cache_dir. None if it can't be written anywhere.
+
+    index_filenames = [get_index_filename(filename)]
+    if cache_dir is not None:
+        index_filenames.append(get_cached_index_filename(filename, cache_dir))
+
+    for index_filename in index_filenames:
+        index = open_passage_index(index_filename, filename)
+        if index is not None:
+            return index
+
+    for index_filename in index_filenames:
+        try:
+            os.makedirs(os.path.dirname(index_filename) or '.', exist_ok=True)
+            build_passage_index(filename, index_filename)
+
+        except OSError:
+            continue
+
+        return PassageIndex(index_filename)
+
+    return None
+
+
+def sample_passage(filename, rng=random):
+
+    # Reservoir sampling over the whole file, for when there's no index. Memory stays constant,
+    # only the passage kept so far is ever decoded.
+
+    chosen = None
+
+    with open(filename, 'rb') as f:
+        for i, offsets in enumerate(iter_passage_offsets(f), start=1):
+            if rng.randrange(i) == 0:
+                chosen = offsets
+
+        if chosen is None:
+            return None
+
+        start, end = chosen
+        f.seek(start)
+
+        return f.read(end - start).decode('utf-8', errors='replace')
+
+
+class PassageCollection:
+
+    def __init__(self, filename, cache_dir=None):
+
+        self.filename = filename
+        # Where the index goes if it can't be written next to the collection.
+        self.cache_dir = cache_dir
+        # Opened on first use.
+        self.index = None
+        self.indexed = None
+
+    @property
+    def quick(self):
+
+        # Whether picking a passage is quick, rather than a pass over the whole collection.
+
+        return bool(self.indexed)
+
+    def get_index(self):
+
+        if self.indexed is None:
+            self.index = load_passage_index(self.filename, self.cache_dir)
+            self.indexed = self.index is not None
+
+        return self.index
+
+    def read(self, number):
+
+        start, end = self.index[number]
+
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start).decode('utf-8', errors='replace')
+
+    def random_passage(self, rng=random):
+
+        index = self.get_index()
+
+        if index is None:
+            return sample_passage(self.filename, rng)
+
+        if not len(index):
+            return None
+
+        return self.read(rng.randrange(len(index)))
+
+    def generate_words(self, rng=random):
+
+        # The words of one random passage, line breaks and all runs of spaces count as one space.
+
+        passage = self.random_passage(rng)
+
+        return iter(passage.split() if passage else ())
+
+    def close(self):
+
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+            self.indexed = None
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Build the offset indexes of passage collections.')
+    parser.add_argument('collections', nargs='+', help='text files of passages separated by blank lines')
+    args = parser.parse_args(argv)
+
+    for filename in args.collections:
+        count = build_passage_index(filename)
+        print(f'{filename}: {count} passages -> {get_index_filename(filename)}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
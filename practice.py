@@ -0,0 +1,163 @@
+import random
+from collections import defaultdict
+
+from utils import corpus_cache, get_letter_states
+
+# How much more likely a word becomes at a 100% error rate, for the word itself and for its bigrams.
+WORD_ERROR_WEIGHT = 8.0
+BIGRAM_ERROR_WEIGHT = 4.0
+# Attempts assumed before anything was recorded, so a single miss doesn't dominate.
+PRIOR_ATTEMPTS = 2
+# How many past sessions the history is mined for.
+HISTORY_SESSIONS = 500
+
+
+class AliasTable:
+
+    # Walker/Vose alias method: O(n) to build, O(1) per weighted draw.
+
+    def __init__(self, weights):
+
+        n = len(weights)
+        total = sum(weights)
+
+        self.probabilities = [0.0] * n
+        self.aliases = [0] * n
+
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+
+        # Whatever's left is 1 up to rounding errors.
+        for i in small + large:
+            self.probabilities[i] = 1.0
+
+    def __len__(self):
+
+        return len(self.probabilities)
+
+    def sample(self, rng=random):
+
+        i = int(rng.random() * len(self.probabilities))
+
+        return i if rng.random() < self.probabilities[i] else self.aliases[i]
+
+
+def get_bigrams(word):
+
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+class PracticeSampler:
+
+    # Draws words of a language favouring those, and those sharing letter bigrams
+    # with the ones, the user got wrong before.
+    #
+    # Recording a session only recomputes the weights of the words it affected,
+    # then rebuilds the alias table once, draws are O(1).
+
+    def __init__(self, language, history=None):
+
+        self.language = language
+        self.corpus = corpus_cache.get(language)
+
+        self.word_indices = {}
+        self.bigram_words = defaultdict(list)
+
+        for i, word in enumerate(self.corpus):
+            self.word_indices[word] = i
+            for bigram in set(get_bigrams(word)):
+                self.bigram_words[bigram].append(i)
+
+        self.word_attempts = defaultdict(int)
+        self.word_errors = defaultdict(int)
+        self.bigram_attempts = defaultdict(int)
+        self.bigram_errors = defaultdict(int)
+
+        self.weights = [1.0] * len(self.corpus)
+        self.table = None
+
+        if history is not None:
+            self.record(history.word_outcomes(language, sessions=HISTORY_SESSIONS))
+
+        else:
+            self.table = AliasTable(self.weights)
+
+    def record(self, outcomes):
+
+        # outcomes are (expected, typed, correct) tuples, or anything with those attributes.
+
+        touched_words = set()
+        touched_bigrams = set()
+
+        for outcome in outcomes:
+
+            if isinstance(outcome, tuple):
+                expected, typed, correct = outcome
+            else:
+                expected, typed, correct = outcome.expected, outcome.typed, outcome.correct
+
+            self.word_attempts[expected] += 1
+            if not correct:
+                self.word_errors[expected] += 1
+            touched_words.add(expected)
+
+            states = get_letter_states(expected, typed)
+
+            for i, bigram in enumerate(get_bigrams(expected)):
+                self.bigram_attempts[bigram] += 1
+                # A bigram counts as missed if either of its letters was.
+                if states[i] is not True or states[i + 1] is not True:
+                    self.bigram_errors[bigram] += 1
+                touched_bigrams.add(bigram)
+
+        affected = {self.word_indices[word] for word in touched_words if word in self.word_indices}
+        for bigram in touched_bigrams:
+            affected.update(self.bigram_words.get(bigram, ()))
+
+        for i in affected:
+            self.weights[i] = self.get_weight(self.corpus[i])
+
+        if affected or self.table is None:
+            self.table = AliasTable(self.weights)
+
+    def get_error_rate(self, attempts, errors):
+
+        return errors / (attempts + PRIOR_ATTEMPTS)
+
+    def get_weight(self, word):
+
+        weight = 1.0 + WORD_ERROR_WEIGHT * self.get_error_rate(self.word_attempts[word], self.word_errors[word])
+
+        bigrams = get_bigrams(word)
+
+        if bigrams:
+            bigram_error_rate = sum(self.get_error_rate(self.bigram_attempts[bigram], self.bigram_errors[bigram])
+                                    for bigram in bigrams) / len(bigrams)
+            weight += BIGRAM_ERROR_WEIGHT * bigram_error_rate
+
+        return weight
+
+    def generate(self, rng=random):
+
+        # Endless stream of weighted draws.
+
+        table = None
+
+        while True:
+            # Picks up a rebuilt table as soon as there's one.
+            if table is not self.table:
+                table = self.table
+                sample = table.sample
+
+            yield self.corpus[sample(rng)]
@@ -0,0 +1,193 @@
+import os
+import time
+import cProfile
+import pstats
+import functools
+import tracemalloc
+
+# Frames kept per allocation traceback.
+TRACEMALLOC_FRAMES = 10
+# Allocation sites listed in the memory report.
+TOP_ALLOCATIONS = 30
+# Rebuilt stacks deeper than this are cut short in the collapsed stacks file.
+MAX_STACK_DEPTH = 64
+# Stack shares below this many microseconds are dropped, which keeps rebuilding the stacks cheap.
+MIN_STACK_US = 1
+
+
+def get_frame_label(func):
+
+    filename, line, name = func
+
+    if filename == '~':
+        # Built-in functions have no file.
+        return name.replace(';', ',')
+
+    return f'{name} ({os.path.basename(filename)}:{line})'.replace(';', ',')
+
+
+def get_collapsed_stacks(stats):
+
+    # cProfile only keeps caller -> callee edges, so the stacks are rebuilt by walking up the callers
+    # from every function and splitting its own time between them, in proportion to the time spent
+    # under each one. Returns {'root;...;function': microseconds}, as flamegraph.pl and speedscope read.
+
+    stacks = {}
+
+    def walk(func, path, us):
+
+        callers = stats[func][4] if func in stats else {}
+        shares = {caller: edge[3] for caller, edge in callers.items() if caller not in path}
+        total = sum(shares.values())
+
+        if not shares or total <= 0 or len(path) >= MAX_STACK_DEPTH:
+            stack = ';'.join(get_frame_label(f) for f in reversed(path))
+            stacks[stack] = stacks.get(stack, 0) + us
+            return
+
+        for caller, share in shares.items():
+            caller_us = us * share / total
+            if caller_us >= MIN_STACK_US:
+                walk(caller, path + [caller], caller_us)
+
+    for func, (_, _, own_time, _, _) in stats.items():
+        if own_time > 0:
+            walk(func, [func], own_time * 1_000_000)
+
+    return {stack: round(us) for stack, us in stacks.items() if round(us) > 0}
+
+
+class Profiler:
+
+    # Profiles some methods of an object with cProfile, and the allocations in between with tracemalloc.
+    # The methods are only wrapped, and tracemalloc only started, while the profiler runs:
+    # until start() is called, and after stop(), the object runs exactly as if it didn't exist.
+
+    def __init__(self, target, method_names):
+
+        self.target = target
+        self.method_names = method_names
+        self.profile = None
+        # How many profiled methods are on the stack, they call each other.
+        self.depth = 0
+        self.calls = 0
+        # Files written so far, numbers the next ones.
+        self.saves = 0
+        self.started_at = None
+        self.started_tracemalloc = False
+        self.first_snapshot = None
+
+    @property
+    def running(self):
+
+        return self.profile is not None
+
+    def start(self):
+
+        if self.running:
+            return
+
+        self.profile = cProfile.Profile()
+        self.depth = 0
+        self.calls = 0
+        self.started_at = time.time()
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        self.first_snapshot = tracemalloc.take_snapshot()
+
+        # Instance attributes shadow the methods, looked up on every call.
+        for name in self.method_names:
+            setattr(self.target, name, self.wrap(getattr(self.target, name)))
+
+    def wrap(self, method):
+
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+
+            # Only the outermost profiled call switches the profiler on and off.
+            if self.depth == 0:
+                self.profile.enable()
+            self.depth += 1
+            self.calls += 1
+
+            try:
+                return method(*args, **kwargs)
+
+            finally:
+                self.depth -= 1
+                # Profiling may have been stopped from within.
+                if self.depth == 0 and self.running:
+                    self.profile.disable()
+
+        return profiled
+
+    def save(self, directory):
+
+        # Dumps what was profiled so far and starts over, returns the files written.
+        # May be called from within a profiled method.
+
+        if not self.running or not self.calls:
+            return []
+
+        profile = self.profile
+        profile.disable()
+
+        snapshot = tracemalloc.take_snapshot()
+
+        os.makedirs(directory, exist_ok=True)
+        # Milliseconds and a counter, so saves within the same second don't overwrite each other.
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        milliseconds = int(self.started_at * 1000) % 1000
+        self.saves += 1
+        base = os.path.join(directory, f'profile-{stamp}.{milliseconds:03}-{self.saves}')
+
+        # For pstats, snakeviz and friends.
+        stats = pstats.Stats(profile)
+        stats.dump_stats(base + '.prof')
+
+        # For flamegraph.pl and speedscope.
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, us in sorted(get_collapsed_stacks(stats.stats).items()):
+                f.write(f'{stack} {us}\n')
+
+        with open(base + '.memory.txt', 'w', encoding='utf-8') as f:
+            f.write(f'Allocated while profiling, top {TOP_ALLOCATIONS} lines\n\n')
+            for stat in snapshot.compare_to(self.first_snapshot, 'lineno')[:TOP_ALLOCATIONS]:
+                f.write(f'{stat}\n')
+            f.write(f'\nLive at the end, top {TOP_ALLOCATIONS} lines\n\n')
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f'{stat}\n')
+
+        # The rest of the call goes to the next profile.
+        self.profile = cProfile.Profile()
+        if self.depth:
+            self.profile.enable()
+        self.calls = 0
+        self.started_at = time.time()
+        self.first_snapshot = tracemalloc.take_snapshot()
+
+        return [base + '.prof', base + '.folded', base + '.memory.txt']
+
+    def stop(self, directory):
+
+        # Saves what's left and puts the methods back.
+
+        if not self.running:
+            return []
+
+        filenames = self.save(directory)
+
+        self.profile.disable()
+        self.profile = None
+        self.first_snapshot = None
+
+        for name in self.method_names:
+            delattr(self.target, name)
+
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+        return filenames
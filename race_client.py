@@ -0,0 +1,105 @@
+import json
+import queue
+import socket
+import threading
+
+from race_server import encode
+
+
+class RaceClient:
+
+    # Connection to a race server for the Tk GUI. A background thread reads the
+    # server's messages into a queue the GUI polls, and another one sends what the GUI
+    # queues, so a stalled connection never blocks the Tk thread. Progress is sent at
+    # most once per call to send_progress, which the GUI makes on its timer tick.
+
+    def __init__(self, host, port, name):
+
+        self.socket = socket.create_connection((host, port), timeout=5)
+        self.socket.settimeout(None)
+
+        self.messages = queue.Queue()
+        self.outgoing = queue.Queue()
+        self.closed = False
+        self.last_progress = None
+
+        self.send({'type': 'join', 'name': name})
+
+        self.reader = threading.Thread(target=self.read_loop, name='race-client', daemon=True)
+        self.reader.start()
+        self.writer = threading.Thread(target=self.write_loop, name='race-client-writer', daemon=True)
+        self.writer.start()
+
+    def send(self, message):
+
+        if not self.closed:
+            self.outgoing.put(message)
+
+    def write_loop(self):
+
+        while True:
+            message = self.outgoing.get()
+
+            # Closing.
+            if message is None:
+                return
+
+            try:
+                self.socket.sendall(encode(message))
+
+            except OSError:
+                self.close()
+                return
+
+    def send_progress(self, words, correct, characters):
+
+        progress = (words, correct, characters)
+
+        # Nothing new to tell.
+        if progress == self.last_progress:
+            return
+
+        self.last_progress = progress
+        self.send({'type': 'progress', 'words': words, 'correct': correct, 'characters': characters})
+
+    def read_loop(self):
+
+        try:
+            with self.socket.makefile('r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.messages.put(json.loads(line))
+                    except ValueError:
+                        continue
+
+        except OSError:
+            pass
+
+        self.messages.put({'type': 'disconnected'})
+
+    def poll(self):
+
+        # Messages received since the last call.
+
+        messages = []
+
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self):
+
+        if self.closed:
+            return
+
+        self.closed = True
+        self.outgoing.put(None)
+
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.socket.close()
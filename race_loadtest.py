@@ -0,0 +1,111 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+from race_server import RaceServer, DEFAULT_PORT, encode
+
+
+# Simulates many racers against a race server, started in-process unless --host is given,
+# and reports how many standings updates reached them and how late.
+
+
+async def simulate_racer(host, port, name, wpm, races, delays, received):
+
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({'type': 'join', 'name': name}))
+
+    typing = None
+
+    async def type_words(words, starts_in):
+        await asyncio.sleep(starts_in)
+        # Progress every 250 ms, at roughly the racer's speed.
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(.25)
+            typed = min(len(words), int((time.monotonic() - start) / 60 * wpm))
+            correct = int(typed * .95)
+            writer.write(encode({'type': 'progress', 'words': typed, 'correct': correct,
+                                 'characters': sum(len(word) + 1 for word in words[:typed])}))
+
+    try:
+        while races > 0:
+
+            line = await reader.readline()
+
+            if not line:
+                break
+
+            message = json.loads(line)
+
+            if message['type'] == 'race':
+                typing = asyncio.create_task(type_words(message['words'], message['starts_in']))
+
+            elif message['type'] == 'standings':
+                received[0] += 1
+                delays.append(time.time() - message['sent_at'])
+
+            elif message['type'] == 'end':
+                races -= 1
+                if typing:
+                    typing.cancel()
+                    typing = None
+
+    finally:
+        if typing:
+            typing.cancel()
+        writer.close()
+
+
+async def run(args):
+
+    server = None
+    host = args.host
+
+    if host is None:
+        host = '127.0.0.1'
+        race_server = RaceServer(duration=args.duration, lobby_time=args.lobby)
+        server = await asyncio.start_server(race_server.handle_client, host, args.port)
+
+    delays = []
+    received = [0]
+    start = time.perf_counter()
+
+    await asyncio.gather(*(simulate_racer(host, args.port, f'racer{i}', random.randint(30, 120), args.races,
+                                          delays, received) for i in range(args.clients)))
+
+    elapsed = time.perf_counter() - start
+
+    if server:
+        server.close()
+        await server.wait_closed()
+
+    print(f'{args.clients} racers, {args.races} race(s) in {elapsed:.1f} s')
+    print(f'standings received: {received[0]} ({received[0] / args.clients:.1f} per racer)')
+
+    if delays:
+        delays.sort()
+        print(f'delivery delay: median {statistics.median(delays) * 1000:.1f} ms,'
+              f' p99 {delays[int(len(delays) * .99)] * 1000:.1f} ms, max {delays[-1] * 1000:.1f} ms')
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Load test the race server with simulated racers.')
+    parser.add_argument('--host', help='race server to test (default: start one in-process)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--races', type=int, default=1)
+    parser.add_argument('--duration', type=int, default=10, help='race length of the in-process server')
+    parser.add_argument('--lobby', type=int, default=3,
+                        help='lobby time of the in-process server, racers joining later wait for the next race')
+    args = parser.parse_args(argv)
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from utils import files, get_random_words
+
+DEFAULT_PORT = 8765
+# Standings are broadcast at most this many times per second.
+TICK_RATE = 4
+# How many racers the standings list.
+STANDINGS_SIZE = 10
+# Clients that fall this far behind on reading are dropped rather than buffered forever.
+MAX_WRITE_BUFFER = 256 * 1024
+
+# Messages are JSON objects, one per line.
+#
+# client -> server
+#   {"type": "join", "name": "..."}
+#   {"type": "progress", "words": 12, "correct": 11, "characters": 70}
+#
+# server -> client
+#   {"type": "race", "seed": 1, "language": "English", "words": [...], "duration": 60, "starts_in": 5.0}
+#   {"type": "standings", "sent_at": 1700000000.0, "racers": 120, "standings": [["name", words, correct], ...]}
+#   {"type": "end", "standings": [...]}
+
+
+def encode(message):
+
+    return (json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class Racer:
+
+    def __init__(self, name, writer):
+
+        self.name = name
+        self.writer = writer
+        self.words = 0
+        self.correct = 0
+        self.characters = 0
+        self.in_race = False
+
+
+class RaceServer:
+
+    # Every racer of a race gets the same seeded word list. Progress updates only
+    # overwrite the racer's state, the standings are broadcast on a fixed tick and
+    # only when something changed, so the cost doesn't grow with the update rate.
+
+    def __init__(self, language='English', num_words=200, duration=60, lobby_time=10, tick_rate=TICK_RATE):
+
+        self.language = language
+        self.num_words = num_words
+        self.duration = duration
+        self.lobby_time = lobby_time
+        self.tick_interval = 1 / tick_rate
+
+        self.racers = set()
+        self.race_task = None
+        self.dirty = False
+
+    async def handle_client(self, reader, writer):
+
+        racer = None
+
+        try:
+            while True:
+
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than the stream's limit, dropped like any other bad line.
+                    continue
+
+                if not line:
+                    break
+
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+
+                if not isinstance(message, dict):
+                    continue
+
+                if message.get('type') == 'join' and racer is None:
+                    racer = Racer(str(message.get('name', 'anonymous'))[:32], writer)
+                    self.racers.add(racer)
+
+                    if self.race_task is None:
+                        self.race_task = asyncio.create_task(self.run_race())
+
+                elif message.get('type') == 'progress' and racer is not None and racer.in_race:
+                    try:
+                        words = int(message.get('words', 0))
+                        correct = int(message.get('correct', 0))
+                        characters = int(message.get('characters', 0))
+                    except (TypeError, ValueError, OverflowError):
+                        continue
+
+                    racer.words = words
+                    racer.correct = correct
+                    racer.characters = characters
+                    self.dirty = True
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            if racer is not None:
+                self.racers.discard(racer)
+            writer.close()
+
+    def broadcast(self, racers, data):
+
+        for racer in list(racers):
+
+            transport = racer.writer.transport
+
+            if transport.is_closing():
+                continue
+
+            if transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+                transport.abort()
+                continue
+
+            racer.writer.write(data)
+
+    def get_standings(self, racers):
+
+        ranked = sorted(racers, key=lambda r: (r.correct, r.characters), reverse=True)[:STANDINGS_SIZE]
+
+        return [[racer.name, racer.words, racer.correct] for racer in ranked]
+
+    async def run_race(self):
+
+        # Races keep coming as long as somebody is connected.
+
+        while self.racers:
+
+            await asyncio.sleep(self.lobby_time)
+
+            racers = [racer for racer in self.racers if not racer.writer.transport.is_closing()]
+
+            if not racers:
+                continue
+
+            seed = random.randrange(2 ** 32)
+            words = get_random_words(num=self.num_words, language=self.language, seed=seed)
+
+            for racer in racers:
+                racer.in_race = True
+                racer.words = racer.correct = racer.characters = 0
+
+            starts_in = 3.0
+            self.broadcast(racers, encode({'type': 'race', 'seed': seed, 'language': self.language,
+                                           'words': words, 'duration': self.duration, 'starts_in': starts_in}))
+
+            deadline = time.monotonic() + starts_in + self.duration
+            self.dirty = True
+
+            while time.monotonic() < deadline:
+
+                await asyncio.sleep(self.tick_interval)
+
+                if self.dirty:
+                    self.dirty = False
+                    racers = [racer for racer in racers if racer in self.racers]
+                    # Encoded once, whatever the number of racers.
+                    self.broadcast(racers, encode({'type': 'standings', 'sent_at': time.time(),
+                                                   'racers': len(racers),
+                                                   'standings': self.get_standings(racers)}))
+
+            racers = [racer for racer in racers if racer in self.racers]
+            self.broadcast(racers, encode({'type': 'end', 'standings': self.get_standings(racers)}))
+
+            for racer in racers:
+                racer.in_race = False
+
+        self.race_task = None
+
+
+async def serve(host, port, race_server):
+
+    server = await asyncio.start_server(race_server.handle_client, host, port)
+
+    print(f'Racing on {", ".join(str(sock.getsockname()) for sock in server.sockets)}', flush=True)
+
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Serve typing races on the local network.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--language', default='English', choices=list(files.keys()))
+    parser.add_argument('--duration', type=int, default=60, help='race length in seconds (default: 60)')
+    parser.add_argument('--lobby', type=int, default=10, help='seconds to wait for racers (default: 10)')
+    parser.add_argument('--words', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    race_server = RaceServer(language=args.language, num_words=args.words, duration=args.duration,
+                             lobby_time=args.lobby)
+
+    try:
+        asyncio.run(serve(args.host, args.port, race_server))
+
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import random
+from datetime import datetime
+
+from session import TypingSession
+from utils import get_changed_runs
+
+
+class KeystrokeRecorder:
+
+    # Records every value the entry takes during a test (each one is what
+    # the entry trace hands to GUI.revalidate_state) along with when it happened.
+
+    def __init__(self, language, case_sensitive=False):
+
+        self.language = language
+        # Passages are scored as written, see TypingSession.
+        self.case_sensitive = case_sensitive
+        self.words = []
+        self.events = []
+        self.start = time.perf_counter()
+
+    def track(self, words):
+
+        # Passes the words through, keeping those the session actually drew.
+
+        for word in words:
+            self.words.append(word)
+            yield word
+
+    def record(self, value: str):
+
+        self.events.append((round(time.perf_counter() - self.start, 6), value))
+
+    def save(self, directory):
+
+        os.makedirs(directory, exist_ok=True)
+
+        filename = os.path.join(directory, f'{datetime.now():%Y%m%d-%H%M%S}-{self.language}.json')
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'language': self.language, 'case_sensitive': self.case_sensitive, 'words': self.words,
+                       'events': self.events}, f, ensure_ascii=False)
+
+        return filename
+
+
+def load_recording(filename):
+
+    with open(filename, encoding='utf-8') as f:
+        recording = json.load(f)
+
+    # Older recordings were all of random words.
+    return (recording['language'], recording['words'], [(t, value) for t, value in recording['events']],
+            recording.get('case_sensitive', False))
+
+
+def synthesize_keystrokes(words, error_rate=0.05, interval=0.06, rng=random):
+
+    # Builds the stream of entry values a user typing the words would produce,
+    # mistyping a letter now and then and correcting it with a backspace.
+
+    events = []
+    t = 0.0
+
+    def emit(value):
+        nonlocal t
+        t += interval
+        events.append((round(t, 6), value))
+
+    for word in words:
+
+        typed = ''
+
+        for letter in word:
+
+            if rng.random() < error_rate:
+                emit(typed + rng.choice('abcdefghijklmnopqrstuvwxyz'))
+                # Backspace.
+                emit(typed)
+
+            typed += letter
+            emit(typed)
+
+        emit(typed + ' ')
+        # Clearing the entry triggers the trace once more.
+        events.append((round(t, 6), ''))
+
+    return events
+
+
+def replay(words, events, timer=time.perf_counter_ns, case_sensitive=False):
+
+    # Feeds the entry values through the scoring and highlighting path as fast as possible.
+    # Returns the time spent on each value, in nanoseconds.
+
+    session = TypingSession(words, case_sensitive=case_sensitive)
+    letter_states = [None] * len(session.current_word)
+    latencies = []
+
+    for _, value in events:
+
+        start = timer()
+
+        result = session.update(value)
+
+        if result.letter_states is not None:
+            # The GUI issues one tag call per run.
+            for _ in get_changed_runs(letter_states, result.letter_states):
+                pass
+            letter_states = result.letter_states
+
+        latencies.append(timer() - start)
+
+        if result.finished:
+            break
+
+    return latencies
@@ -0,0 +1,155 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from itertools import zip_longest
+from multiprocessing import Pool
+
+from utils import align_word, MATCH, DELETION
+
+CSV_COLUMNS = ['file', 'words', 'typed_words', 'correct_words', 'typed_characters', 'correct_characters',
+               'omitted_characters', 'accuracy']
+
+
+# Scores recorded tests offline, across a pool of processes.
+#
+# A test is either a .json file holding {"expected": "...", "typed": "..."},
+# or a text file whose first line is the expected text and second line what was typed.
+# Words are paired up in order and scored like the GUI scores them.
+
+
+def iter_files(paths):
+
+    # Streams the files under the given paths, without listing everything up front.
+
+    for path in paths:
+
+        if os.path.isdir(path):
+            for root, dirs, filenames in os.walk(path):
+                dirs.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(('.json', '.txt')):
+                        yield os.path.join(root, filename)
+
+        else:
+            yield path
+
+
+def read_test(filename):
+
+    with open(filename, encoding='utf-8') as f:
+
+        if filename.endswith('.json'):
+            test = json.load(f)
+            return test['expected'], test['typed']
+
+        expected = f.readline()
+        typed = f.readline()
+
+        return expected, typed
+
+
+def score_text(expected, typed):
+
+    expected_words = expected.lower().split()
+    typed_words = typed.lower().split()
+
+    correct_words = 0
+    typed_characters = 0
+    correct_characters = 0
+    omitted_characters = 0
+
+    for i, (expected_word, typed_word) in enumerate(zip_longest(expected_words, typed_words[:len(expected_words)],
+                                                                fillvalue='')):
+
+        typed_characters += len(typed_word)
+
+        if typed_word and expected_word == typed_word:
+            correct_words += 1
+
+        _, counts, _ = align_word(expected_word, typed_word)
+        correct_characters += counts[MATCH]
+        # Left out letters are errors, but the words after the last one typed were never reached.
+        if i < len(typed_words):
+            omitted_characters += counts[DELETION]
+
+    attempted = typed_characters + omitted_characters
+
+    return {
+        'words': len(expected_words),
+        'typed_words': min(len(typed_words), len(expected_words)),
+        'correct_words': correct_words,
+        'typed_characters': typed_characters,
+        'correct_characters': correct_characters,
+        'omitted_characters': omitted_characters,
+        'accuracy': round(correct_characters / attempted * 100, 2) if attempted else 0.0,
+    }
+
+
+def score_file(filename):
+
+    # Whatever is wrong with a file, it only fails that file, never the whole batch.
+    try:
+        expected, typed = read_test(filename)
+        result = score_text(expected, typed)
+
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        return filename, None, f'{type(e).__name__}: {e}'
+
+    return filename, result, None
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Score recorded typing tests in bulk.')
+    parser.add_argument('paths', nargs='+', help='test files, or directories to search for them')
+    parser.add_argument('-o', '--output', default='-', help='CSV file for the per-test results (default: stdout)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='files handed to a worker at a time (default: 64)')
+    args = parser.parse_args(argv)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+
+    totals = dict.fromkeys(CSV_COLUMNS[1:-1], 0)
+    scored = 0
+    failed = 0
+    start = time.perf_counter()
+
+    try:
+        writer = csv.writer(output)
+        writer.writerow(CSV_COLUMNS)
+
+        with Pool(args.jobs) as pool:
+
+            # Results are written as they arrive, in whatever order workers finish.
+            for filename, result, error in pool.imap_unordered(score_file, iter_files(args.paths),
+                                                                chunksize=args.chunk_size):
+
+                if result is None:
+                    failed += 1
+                    print(f'{filename}: {error}', file=sys.stderr)
+                    continue
+
+                scored += 1
+                writer.writerow([filename] + [result[column] for column in CSV_COLUMNS[1:]])
+
+                for column in totals:
+                    totals[column] += result[column]
+
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    attempted = totals['typed_characters'] + totals['omitted_characters']
+    accuracy = totals['correct_characters'] / attempted * 100 if attempted else 0
+
+    print(f'Scored {scored} tests ({failed} failed) in {elapsed:.2f} s, {scored / max(elapsed, 1e-9):,.0f} tests/s',
+          file=sys.stderr)
+    print(f'Words: {totals["correct_words"]}/{totals["words"]} correct, accuracy {accuracy:.2f}%', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
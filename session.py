@@ -0,0 +1,536 @@
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from utils import align_word, get_letter_states, ALIGNMENT_BAND, MATCH, DELETION
+from metrics import RollingWindow, CHARACTERS, CORRECT_CHARACTERS, CORRECT_WORDS, OMITTED_CHARACTERS
+from keylog import KeystrokeLog, COMMIT_CORRECT, COMMIT_WRONG, MISS, OMIT
+
+# Longest line, in characters, of the laid out text.
+LINE_WIDTH = 45
+# How many of the latest word results a session keeps.
+MAX_WORD_RESULTS = 1000
+# Length of the rolling window for live stats, in seconds.
+ROLLING_WINDOW = 10
+# How many upcoming words a typed word is matched against, to detect skipped and merged words.
+LOOKAHEAD_WORDS = 3
+# Shortest start of a word that a space may split off, to be completed by the next input.
+MIN_SPLIT_LENGTH = 2
+# A typed word is only taken for a later word, skipping or merging words, if it's at least this long
+# and more than this many edits away from the current word (two covers swapped letters).
+# Short words are too often typos of each other.
+MIN_REALIGN_LENGTH = 4
+MAX_TYPO_EDITS = 2
+
+
+@dataclass
+class WordResult:
+
+    # How the user did on a single word of the test.
+
+    index: int
+    expected: str
+    typed: str
+    correct: bool
+    correct_characters: int
+    # Where the word is in the laid out text, see WordLayout.
+    line: int
+    start_idx: int
+    end_idx: int
+
+
+@dataclass
+class InputResult:
+
+    # What changed after feeding the entry contents to the session.
+
+    # Letter states of the current word (see utils.get_letter_states),
+    # None if the input is longer than the word and the highlighting should stay as it is.
+    letter_states: list | None = None
+    # Words completed when the input ended with a space. Usually one, more when the user
+    # skipped or merged words, none when the space split the current word.
+    committed: list = field(default_factory=list)
+    # The input ended with a space, the entry should be cleared.
+    clear_input: bool = False
+    # All words were traversed.
+    finished: bool = False
+
+
+@dataclass
+class SessionResult:
+
+    cpm: int
+    ccpm: int
+    wpm: int
+    accuracy: float
+    word_results: list = field(default_factory=list)
+
+
+class WordLayout:
+
+    # Wraps the words into lines of at most line_width characters, the way the
+    # text widget would, so that front-ends can render the text a few lines at a time
+    # and still know where every word is.
+    #
+    # Words are pulled from the source only as lines are needed, and the lines
+    # already typed can be forgotten, so memory stays flat even when the source never ends.
+    # Word and line numbers are always absolute, counted from the start of the test.
+
+    def __init__(self, words, line_width=LINE_WIDTH):
+
+        self.source = iter(words)
+        self.exhausted = False
+        self.line_width = line_width
+
+        # Absolute index of self.words[0] and line of self.line_starts[0].
+        self.first_word = 0
+        self.first_line = 0
+
+        self.words = []
+        # (line, column) of every word.
+        self.positions = []
+        # Index of the first word of every line.
+        self.line_starts = []
+        # Length of the last line.
+        self.line_length = 0
+
+    @property
+    def total_words(self):
+
+        return self.first_word + len(self.words)
+
+    @property
+    def total_lines(self):
+
+        return self.first_line + len(self.line_starts)
+
+    @property
+    def complete_lines(self):
+
+        # Lines that can't get any more words, only those are safe to render.
+
+        return self.total_lines if self.exhausted else self.total_lines - 1
+
+    def pull(self):
+
+        # Lays out one more word from the source, returns False once it's exhausted.
+
+        word = next(self.source, None)
+
+        if word is None:
+            self.exhausted = True
+            return False
+
+        if self.line_starts and self.line_length + 1 + len(word) <= self.line_width:
+            column = self.line_length + 1  # +1 is the space in between words.
+
+        else:
+            self.line_starts.append(self.total_words)
+            column = 0
+
+        self.positions.append((self.total_lines - 1, column))
+        self.words.append(word)
+        self.line_length = column + len(word)
+
+        return True
+
+    def ensure_word(self, index):
+
+        while index >= self.total_words and self.pull():
+            pass
+
+        return index < self.total_words
+
+    def ensure_lines(self, count):
+
+        while self.complete_lines < count and self.pull():
+            pass
+
+    def word(self, index):
+
+        if not self.ensure_word(index):
+            return None
+
+        return self.words[index - self.first_word]
+
+    def position(self, index):
+
+        self.ensure_word(index)
+
+        return self.positions[index - self.first_word]
+
+    def line_text(self, line):
+
+        i = line - self.first_line
+        start = self.line_starts[i] - self.first_word
+        end = self.line_starts[i + 1] - self.first_word if i + 1 < len(self.line_starts) else len(self.words)
+
+        return ' '.join(self.words[start:end])
+
+    def trim(self, line):
+
+        # Forgets the lines before the given one.
+
+        i = line - self.first_line
+
+        if i <= 0:
+            return
+
+        dropped_words = self.line_starts[i] - self.first_word
+
+        del self.words[:dropped_words]
+        del self.positions[:dropped_words]
+        del self.line_starts[:i]
+
+        self.first_word += dropped_words
+        self.first_line = line
+
+
+class LookaheadIndex:
+
+    # The next few words from the current one, indexed by word and by pair of adjacent
+    # words run together, so a typed word can be matched against them with a dict lookup.
+    # Rebuilt as the current word moves, which costs a constant LOOKAHEAD_WORDS steps.
+
+    def __init__(self, layout, size=LOOKAHEAD_WORDS):
+
+        self.layout = layout
+        self.size = size
+        self.start = None
+        self.words = {}
+        self.pairs = {}
+
+    def update(self, start):
+
+        if start == self.start:
+            return
+
+        self.start = start
+        self.words = {}
+        self.pairs = {}
+
+        previous = None
+
+        for offset in range(self.size + 1):
+
+            word = self.layout.word(start + offset)
+
+            if word is None:
+                break
+
+            # The nearest occurrence wins.
+            self.words.setdefault(word, offset)
+
+            if previous is not None:
+                self.pairs.setdefault(previous + word, offset - 1)
+
+            previous = word
+
+    def find_word(self, typed):
+
+        # How many words ahead typed is, 0 being the current word.
+
+        return self.words.get(typed)
+
+    def find_pair(self, typed):
+
+        # How many words ahead the pair of words typed without a space starts.
+
+        return self.pairs.get(typed)
+
+
+class TypingSession:
+
+    # The scoring state of a single test, free of any UI so it can be
+    # driven by the Tk GUI, other front-ends, tests and benchmarks alike.
+    #
+    # The words may be any iterable, including an endless generator.
+    # Typing is case insensitive unless case_sensitive is set, as for passages.
+
+    def __init__(self, words, line_width=LINE_WIDTH, rolling_window=ROLLING_WINDOW, clock=time.monotonic,
+                 case_sensitive=False):
+
+        self.layout = WordLayout(words, line_width)
+        self.case_sensitive = case_sensitive
+        self.clock = clock
+        self.rolling = RollingWindow(window=rolling_window)
+
+        # Only the latest results are kept, so memory doesn't grow with the length of the test.
+        self.word_results = deque(maxlen=MAX_WORD_RESULTS)
+        self.typed_words = 0
+
+        # Every input event, the stats are derived from it.
+        self.log = KeystrokeLog()
+        self.previous_input = ''
+
+        self.lookahead = LookaheadIndex(self.layout)
+        # Start of the current word split off by a space, waiting for the rest.
+        self.split_prefix = ''
+        # Pasted characters before the current word, pasted words earn nothing.
+        self.word_start_pasted_characters = 0
+
+    @property
+    def typed_characters(self):
+
+        # Characters actually typed, pastes and deletions don't count.
+
+        return self.log.characters
+
+    @property
+    def correctly_typed_characters(self):
+
+        return self.log.correct_characters
+
+    @property
+    def omitted_characters(self):
+
+        # Letters of completed words that were left out, skipped words included.
+
+        return self.log.omitted_characters
+
+    @property
+    def correct_words(self):
+
+        return self.log.correct_words
+
+    @property
+    def current_word_idx(self):
+
+        return self.typed_words
+
+    @property
+    def current_word(self):
+
+        # The word the user is currently trying to type, None once all words were traversed.
+
+        return self.layout.word(self.current_word_idx)
+
+    @property
+    def current_word_position(self):
+
+        # (line, column) of the current word.
+
+        return self.layout.position(self.current_word_idx)
+
+    @property
+    def finished(self):
+
+        return self.current_word is None
+
+    def update(self, user_input: str):
+
+        # Feeds the current contents of the input, called on every change.
+
+        curr_word = self.current_word
+
+        if curr_word is None:
+            return InputResult(finished=True)
+
+        if not self.case_sensitive:
+            user_input = user_input.lower()
+        stripped_user_input = user_input.strip()
+
+        # If user pressed the space bar
+        if len(user_input) > 0 and user_input[-1] == ' ':
+
+            # Whatever came along with the space.
+            self.log.log_input_change(self.clock(), self.previous_input, user_input[:-1])
+            # The input is cleared next, which isn't the user's doing.
+            self.previous_input = ''
+
+            # A lone space doesn't complete a word.
+            if len(stripped_user_input) == 0:
+                return InputResult(clear_input=True)
+
+            committed = self.commit_input(stripped_user_input)
+            next_word = self.current_word
+
+            if next_word is None:
+                letter_states = None
+            elif self.split_prefix:
+                letter_states = get_letter_states(next_word, self.split_prefix)
+            else:
+                letter_states = [None] * len(next_word)
+
+            return InputResult(
+                letter_states=letter_states,
+                committed=committed,
+                clear_input=True,
+                finished=next_word is None,
+            )
+
+        now = self.clock()
+        typed_characters = self.log.characters
+
+        self.log.log_input_change(now, self.previous_input, user_input)
+        typed = self.split_prefix + stripped_user_input
+
+        # If user inputted way more characters than current word has, there's no need to update the highlighting.
+        if len(typed) > len(curr_word) + ALIGNMENT_BAND:
+            letter_states = last = None
+        else:
+            letter_states, _, last = align_word(curr_word, typed, partial=True)
+
+        if self.log.characters != typed_characters:
+            self.rolling.add(now, CHARACTERS)
+
+            # Per key error rates need the letter that should have been typed, see analytics.py.
+            # It's the one the alignment pairs the new letter with, so a missed letter is only
+            # charged once rather than to every key after it.
+            if user_input.startswith(self.previous_input) and typed:
+                if last is None:
+                    # An extra letter, no attempt at any key.
+                    self.log.append(now, MISS, 0)
+                elif typed[-1] != curr_word[last]:
+                    self.log.append(now, MISS, ord(curr_word[last]))
+
+        self.previous_input = user_input
+
+        if letter_states is None:
+            return InputResult()
+
+        return InputResult(letter_states=letter_states)
+
+    def commit_input(self, typed):
+
+        # Pairs what was typed before a space with the words it stands for, realigning
+        # with the text when the user skipped a word, ran two together or split one.
+        # Returns the completed words.
+
+        committed = []
+        curr_word = self.current_word
+
+        if self.split_prefix:
+
+            joined = self.split_prefix + typed
+
+            if joined == curr_word:
+                self.split_prefix = ''
+                committed.append(self.commit_word(curr_word, joined))
+                return committed
+
+            if curr_word.startswith(joined):
+                # Split once more.
+                self.split_prefix = joined
+                return committed
+
+            # The first part was all the user typed of the word after all.
+            committed.append(self.commit_word(curr_word, self.split_prefix))
+            self.split_prefix = ''
+
+            curr_word = self.current_word
+            if curr_word is None:
+                return committed
+
+        if typed != curr_word and self.is_realignable(curr_word, typed):
+
+            self.lookahead.update(self.current_word_idx)
+
+            # Words were skipped.
+            offset = self.lookahead.find_word(typed)
+            if offset:
+                for _ in range(offset):
+                    committed.append(self.commit_word(self.current_word, ''))
+                committed.append(self.commit_word(self.current_word, typed))
+                return committed
+
+            # Two words without the space in between, possibly after skipped ones.
+            offset = self.lookahead.find_pair(typed)
+            if offset is not None:
+                for _ in range(offset):
+                    committed.append(self.commit_word(self.current_word, ''))
+                first_word = self.current_word
+                committed.append(self.commit_word(first_word, typed[:len(first_word)]))
+                committed.append(self.commit_word(self.current_word, typed[len(first_word):]))
+                return committed
+
+        # A space in the middle of the word, the rest should follow.
+        if typed != curr_word and len(typed) >= MIN_SPLIT_LENGTH and curr_word.startswith(typed):
+            self.split_prefix = typed
+            return committed
+
+        committed.append(self.commit_word(curr_word, typed))
+
+        return committed
+
+    def is_realignable(self, curr_word, typed):
+
+        # Whether typed is too far from the current word to be a typo of it.
+
+        if len(typed) < MIN_REALIGN_LENGTH:
+            return False
+
+        _, counts, _ = align_word(curr_word, typed)
+
+        return sum(counts) - counts[MATCH] > MAX_TYPO_EDITS
+
+    def commit_word(self, curr_word, typed):
+
+        line, start_idx = self.current_word_position
+        end_idx = start_idx + len(curr_word)
+
+        correct = curr_word == typed
+        now = self.clock()
+
+        # Get how many characters the user got right, and how many were left out
+        _, counts, _ = align_word(curr_word, typed)
+        correct_characters = counts[MATCH]
+        omitted_characters = counts[DELETION]
+
+        pasted = self.log.pasted_characters > self.word_start_pasted_characters
+        self.word_start_pasted_characters = self.log.pasted_characters
+
+        if pasted:
+            self.log.append(now, COMMIT_WRONG, 0)
+
+        else:
+            self.log.append(now, COMMIT_CORRECT if correct else COMMIT_WRONG, correct_characters)
+            self.rolling.add(now, CORRECT_CHARACTERS, correct_characters)
+            if correct:
+                self.rolling.add(now, CORRECT_WORDS)
+            if omitted_characters:
+                self.log.append(now, OMIT, omitted_characters)
+                self.rolling.add(now, OMITTED_CHARACTERS, omitted_characters)
+
+        word_result = WordResult(index=self.current_word_idx, expected=curr_word, typed=typed, correct=correct,
+                                 correct_characters=correct_characters, line=line, start_idx=start_idx,
+                                 end_idx=end_idx)
+        self.word_results.append(word_result)
+        self.typed_words += 1
+
+        # The lines before the next word won't be needed anymore.
+        if self.current_word is not None:
+            next_line, _ = self.current_word_position
+            self.layout.trim(next_line)
+
+        return word_result
+
+    def result(self, elapsed=60, with_words=True):
+
+        # Rates are per minute, elapsed is the length of the test in seconds.
+        # Live stats can skip copying the word results.
+        minutes = max(elapsed, 1) / 60
+
+        # CPM - Characters per minute.
+        cpm = round(self.typed_characters / minutes)
+        # Corrected CPM, left out letters are taken off as they took no time to type.
+        ccpm = round(max(0, self.correctly_typed_characters - self.omitted_characters) / minutes)
+        # WPM - Words per minute.
+        wpm = round(self.correct_words / minutes)
+        # Accuracy, left out letters count as errors.
+        acc = 0.0
+        attempted = self.typed_characters + self.omitted_characters
+        if attempted:
+            acc = round(self.correctly_typed_characters / attempted * 100, 2)
+
+        word_results = list(self.word_results) if with_words else []
+
+        return SessionResult(cpm=cpm, ccpm=ccpm, wpm=wpm, accuracy=acc, word_results=word_results)
+
+    def rolling_result(self):
+
+        # Stats over the last few seconds only.
+
+        cpm, ccpm, wpm, acc = self.rolling.rates(self.clock())
+
+        return SessionResult(cpm=cpm, ccpm=ccpm, wpm=wpm, accuracy=acc)
@@ -0,0 +1,167 @@
+import unittest
+
+from keylog import MISS
+from session import TypingSession
+
+
+def type_text(session, text):
+
+    # Feeds text to the session one character at a time, like the entry does,
+    # and returns every word completed along the way.
+
+    committed = []
+    current = ''
+
+    for character in text:
+        current += character
+        result = session.update(current)
+        committed.extend(result.committed)
+
+        if result.clear_input:
+            current = ''
+            session.update(current)
+
+    return committed
+
+
+def outcomes(committed):
+
+    return [(word.expected, word.typed, word.correct) for word in committed]
+
+
+class RealignmentTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.now = 0.0
+
+    def make_session(self, text):
+
+        return TypingSession(iter(text.split()), clock=lambda: self.now)
+
+    def test_correct_words(self):
+
+        session = self.make_session('the quick brown fox')
+        committed = type_text(session, 'the quick brown fox ')
+
+        self.assertTrue(all(word.correct for word in committed))
+        self.assertTrue(session.finished)
+
+    def test_skipped_word(self):
+
+        session = self.make_session('the quick brown fox')
+        committed = type_text(session, 'the brown fox ')
+
+        self.assertEqual(outcomes(committed), [
+            ('the', 'the', True),
+            ('quick', '', False),
+            ('brown', 'brown', True),
+            ('fox', 'fox', True),
+        ])
+
+    def test_merged_words(self):
+
+        session = self.make_session('the quick brown fox')
+        committed = type_text(session, 'the quickbrown fox ')
+
+        self.assertEqual(outcomes(committed), [
+            ('the', 'the', True),
+            ('quick', 'quick', True),
+            ('brown', 'brown', True),
+            ('fox', 'fox', True),
+        ])
+
+    def test_split_word(self):
+
+        session = self.make_session('the quick brown fox')
+        committed = type_text(session, 'the qu ick brown fox ')
+
+        self.assertEqual(outcomes(committed), [
+            ('the', 'the', True),
+            ('quick', 'quick', True),
+            ('brown', 'brown', True),
+            ('fox', 'fox', True),
+        ])
+
+    def test_split_word_abandoned(self):
+
+        session = self.make_session('the quick brown fox')
+        committed = type_text(session, 'the qu brown fox ')
+
+        self.assertEqual(outcomes(committed), [
+            ('the', 'the', True),
+            ('quick', 'qu', False),
+            ('brown', 'brown', True),
+            ('fox', 'fox', True),
+        ])
+
+    def test_typo_equal_to_upcoming_word(self):
+
+        # 'on' is a typo of 'in', not the 'on' two words later.
+        session = self.make_session('in the on way to my home today')
+        committed = type_text(session, 'on the on way to my home today ')
+
+        self.assertEqual([word.correct for word in committed], [False] + [True] * 7)
+        self.assertEqual(session.correct_words, 7)
+
+    def test_one_edit_from_current_word(self):
+
+        # Within one edit of the current word, even if long enough to be a later one.
+        session = self.make_session('form from the')
+        committed = type_text(session, 'from from the ')
+
+        self.assertEqual([word.correct for word in committed], [False, True, True])
+
+
+
+class ResultTest(unittest.TestCase):
+
+    def test_left_out_letters_lower_accuracy(self):
+
+        session = TypingSession(iter('hello world foo end'.split()), clock=lambda: 0.0)
+        type_text(session, 'helo world fo end ')
+
+        result = session.result(elapsed=60)
+
+        # 14 letters typed right, 2 left out.
+        self.assertEqual(result.accuracy, round(14 / 16 * 100, 2))
+        self.assertEqual(result.ccpm, 12)
+
+    def test_skipped_word_lowers_accuracy(self):
+
+        session = TypingSession(iter('the quick brown fox'.split()), clock=lambda: 0.0)
+        type_text(session, 'the brown fox ')
+
+        self.assertLess(session.result().accuracy, 100)
+
+
+class MissTest(unittest.TestCase):
+
+    def get_misses(self, word, text):
+
+        session = TypingSession(iter([word, 'end']), clock=lambda: 0.0)
+        type_text(session, text)
+
+        return [chr(value) if value else '' for kind, value in zip(session.log.kinds, session.log.values)
+                if kind == MISS]
+
+    def test_correct_word(self):
+
+        self.assertEqual(self.get_misses('hello', 'hello'), [])
+
+    def test_missed_letter_charged_once(self):
+
+        # Only the 'e' was missed, the letters after it were typed right.
+        self.assertEqual(self.get_misses('hello', 'hllo'), ['e'])
+
+    def test_wrong_letter(self):
+
+        self.assertEqual(self.get_misses('hello', 'jello'), ['h'])
+
+    def test_extra_letters(self):
+
+        self.assertEqual(self.get_misses('hello', 'helloxx'), ['', ''])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import random
+import unittest
+
+from utils import align_word, get_letter_states, ALIGNMENT_BAND, MATCH, SUBSTITUTION, INSERTION, DELETION
+
+
+def levenshtein(a, b):
+
+    # Plain full table edit distance, the reference align_word is checked against.
+
+    previous = list(range(len(b) + 1))
+
+    for i, x in enumerate(a, start=1):
+        current = [i]
+        for j, y in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+
+    return previous[-1]
+
+
+def edits(counts):
+
+    return counts[SUBSTITUTION] + counts[INSERTION] + counts[DELETION]
+
+
+class AlignWordTest(unittest.TestCase):
+
+    def setUp(self):
+
+        rng = random.Random(1234)
+        self.pairs = []
+
+        for _ in range(2000):
+            expected = ''.join(rng.choice('abcde') for _ in range(rng.randrange(9)))
+            actual = list(expected)
+            # A few random edits, sometimes more than the band.
+            for _ in range(rng.randrange(5)):
+                position = rng.randrange(len(actual) + 1)
+                edit = rng.randrange(3)
+                if edit == 0 or not actual[position:]:
+                    actual.insert(position, rng.choice('abcde'))
+                elif edit == 1:
+                    actual[position] = rng.choice('abcde')
+                else:
+                    del actual[position]
+            self.pairs.append((expected, ''.join(actual)))
+
+    def test_distance(self):
+
+        for expected, actual in self.pairs:
+            with self.subTest(expected=expected, actual=actual):
+                _, counts, _ = align_word(expected, actual)
+                distance = levenshtein(expected, actual)
+
+                # Exact within the band, never below the true distance outside it.
+                band = max(ALIGNMENT_BAND, abs(len(expected) - len(actual)))
+                if distance <= band:
+                    self.assertEqual(edits(counts), distance)
+                else:
+                    self.assertGreaterEqual(edits(counts), distance)
+
+                # Every letter of both words is accounted for once.
+                self.assertEqual(counts[MATCH] + counts[SUBSTITUTION] + counts[INSERTION], len(actual))
+                self.assertEqual(counts[MATCH] + counts[SUBSTITUTION] + counts[DELETION], len(expected))
+
+    def test_partial_distance(self):
+
+        for expected, actual in self.pairs:
+            with self.subTest(expected=expected, actual=actual):
+                _, counts, _ = align_word(expected, actual, partial=True)
+
+                # Against the closest prefix of the expected word the alignment could end in.
+                m = len(actual)
+                band = max(ALIGNMENT_BAND, m - len(expected))
+                ends = range(max(0, m - band), min(len(expected), m + band) + 1)
+                distance = min(levenshtein(expected[:j], actual) for j in ends)
+
+                if distance <= band:
+                    self.assertEqual(edits(counts), distance)
+                else:
+                    self.assertGreaterEqual(edits(counts), distance)
+
+                self.assertEqual(counts[MATCH] + counts[SUBSTITUTION] + counts[INSERTION], m)
+
+    def test_states(self):
+
+        for expected, actual in self.pairs:
+            with self.subTest(expected=expected, actual=actual):
+                states, counts, _ = align_word(expected, actual)
+
+                self.assertEqual(len(states), len(expected))
+                self.assertNotIn(None, states)
+                if expected:
+                    self.assertEqual(all(states), expected == actual)
+
+    def test_last_letter(self):
+
+        self.assertEqual(align_word('hello', 'hel', partial=True)[2], 2)
+        # The 'l' typed after a missed 'e' is the first 'l'.
+        self.assertEqual(align_word('hello', 'hl', partial=True)[2], 1)
+        self.assertEqual(align_word('hello', 'hll', partial=True)[2], 2)
+        # Past the end of the word.
+        self.assertIsNone(align_word('hello', 'hellox', partial=True)[2])
+
+    def test_prefix(self):
+
+        self.assertEqual(get_letter_states('hello', 'hel'), [True, True, True, None, None])
+        self.assertEqual(get_letter_states('hello', 'hll'), [True, False, True, None, None])
+
+    def test_empty_words(self):
+
+        self.assertEqual(align_word('', ''), ([], [0, 0, 0, 0], None))
+        self.assertEqual(align_word('', '', partial=True), ([], [0, 0, 0, 0], None))
+
+        states, counts, last = align_word('', 'abc')
+        self.assertEqual((states, counts, last), ([], [0, 0, 3, 0], None))
+
+        states, counts, last = align_word('abc', '')
+        self.assertEqual((states, counts, last), ([False] * 3, [0, 0, 0, 3], None))
+
+        # Nothing typed yet.
+        self.assertEqual(align_word('abc', '', partial=True), ([None] * 3, [0, 0, 0, 0], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,303 @@
+import sys
+import time
+import curses
+import locale
+import argparse
+from collections import deque
+
+from utils import files, generate_random_words
+from session import TypingSession
+
+# Lines of text shown, the one before the current word's line included.
+TEXT_LINES = 6
+LINES_BEHIND = 1
+# Input is polled this often, which also paces the timer, in milliseconds.
+POLL_MS = 50
+# Color pairs.
+CORRECT_PAIR = 1
+WRONG_PAIR = 2
+HIGHLIGHT_PAIR = 3
+WARNING_PAIR = 4
+
+ESCAPE = '\x1b'
+BACKSPACE_KEYS = ('\x7f', '\b', curses.KEY_BACKSPACE)
+ENTER_KEYS = ('\n', '\r', curses.KEY_ENTER)
+
+
+class ScreenBuffer:
+
+    # Remembers what's on the terminal and only repaints the cells that changed,
+    # one call per run of changed cells sharing the same attributes.
+
+    def __init__(self, window):
+
+        self.window = window
+        self.rows = []
+
+    def draw(self, frame):
+
+        # frame is a list of rows, each a list of (character, attributes) cells.
+
+        height, width = self.window.getmaxyx()
+
+        if len(self.rows) != height:
+            self.rows = [[] for _ in range(height)]
+
+        for y in range(height):
+
+            new = frame[y][:width - 1] if y < len(frame) else []
+            old = self.rows[y]
+
+            if new == old:
+                continue
+
+            # Cleared cells are drawn as spaces.
+            length = max(len(new), len(old))
+            new_padded = new + [(' ', 0)] * (length - len(new))
+            old_padded = old + [(' ', 0)] * (length - len(old))
+
+            x = 0
+
+            while x < length:
+
+                if new_padded[x] == old_padded[x]:
+                    x += 1
+                    continue
+
+                start = x
+                attributes = new_padded[x][1]
+
+                while x < length and new_padded[x] != old_padded[x] and new_padded[x][1] == attributes:
+                    x += 1
+
+                text = ''.join(character for character, _ in new_padded[start:x])
+                self.window.addstr(y, start, text, attributes)
+
+            self.rows[y] = new
+
+        self.window.noutrefresh()
+        curses.doupdate()
+
+    def invalidate(self):
+
+        self.rows = []
+        self.window.clear()
+
+
+def make_row(text, attributes=0):
+
+    return [(character, attributes) for character in text]
+
+
+class TerminalApp:
+
+    def __init__(self, window, language, duration):
+
+        self.window = window
+        self.screen = ScreenBuffer(window)
+        self.language = language
+        self.duration = duration
+
+        self.session = None
+        self.user_input = ''
+        self.letter_states = []
+        # Results of the words still on screen, by word index.
+        self.word_results = deque()
+        self.start_time = None
+        self.result = None
+
+        self.reset()
+
+    def reset(self):
+
+        self.session = TypingSession(generate_random_words(self.language))
+        self.user_input = ''
+        self.letter_states = [None] * len(self.session.current_word)
+        self.word_results.clear()
+        self.start_time = None
+        self.result = None
+
+    def elapsed(self):
+
+        return time.monotonic() - self.start_time if self.start_time is not None else 0
+
+    def handle_key(self, key):
+
+        # Returns False to quit.
+
+        if key == ESCAPE:
+            return False
+
+        if key in ENTER_KEYS:
+            # Enter ends an endless test, or starts a new one.
+            if self.duration is None and self.start_time is not None and self.result is None:
+                self.finish()
+            else:
+                self.reset()
+            return True
+
+        if self.result is not None:
+            return True
+
+        if key in BACKSPACE_KEYS:
+            self.user_input = self.user_input[:-1]
+
+        elif isinstance(key, str) and key.isprintable():
+            self.user_input += key
+
+        else:
+            return True
+
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+        result = self.session.update(self.user_input)
+
+        self.word_results.extend(result.committed)
+
+        if result.letter_states is not None:
+            self.letter_states = result.letter_states
+
+        if result.clear_input:
+            self.user_input = ''
+
+        if result.finished:
+            self.finish()
+
+        return True
+
+    def tick(self):
+
+        if self.result is None and self.duration is not None and self.start_time is not None:
+            if self.elapsed() >= self.duration:
+                self.finish()
+
+    def finish(self):
+
+        self.result = self.session.result(elapsed=self.elapsed())
+
+    def build_frame(self):
+
+        frame = []
+
+        if self.result is not None:
+            result = self.result
+            frame.append(make_row(f'CPM: {result.cpm}  CCPM: {result.ccpm}  WPM: {result.wpm}  '
+                                  f'ACC: {result.accuracy}%', curses.A_BOLD))
+            frame.append([])
+            frame.append(make_row('Enter: new test   Esc: quit'))
+            return frame
+
+        elapsed = int(self.elapsed())
+
+        if self.duration is None:
+            header = f'{self.language}  Time elapsed: {elapsed // 60:02}:{elapsed % 60:02}'
+            header_attributes = curses.color_pair(CORRECT_PAIR)
+        else:
+            remaining = max(0, self.duration - elapsed)
+            header = f'{self.language}  Time remaining: {remaining // 60:02}:{remaining % 60:02}'
+            header_attributes = curses.color_pair(WRONG_PAIR if remaining < self.duration * .15 else
+                                                  WARNING_PAIR if remaining < self.duration * .4 else CORRECT_PAIR)
+
+        if self.start_time is not None:
+            live = self.session.rolling_result()
+            header += f'  WPM: {live.wpm}  ACC: {live.accuracy}%'
+
+        frame.append(make_row(header, header_attributes))
+        frame.append([])
+
+        layout = self.session.layout
+        curr_idx = self.session.current_word_idx
+        curr_line, curr_column = self.session.current_word_position
+        first_line = max(0, curr_line - LINES_BEHIND)
+        layout.ensure_lines(first_line + TEXT_LINES)
+
+        # Forget results that scrolled away.
+        while self.word_results and self.word_results[0].line < first_line:
+            self.word_results.popleft()
+
+        results_by_line = {}
+        for word in self.word_results:
+            results_by_line.setdefault(word.line, []).append(word)
+
+        for line in range(first_line, min(first_line + TEXT_LINES, layout.complete_lines)):
+
+            if line < layout.first_line:
+                # Already forgotten by the layout, rebuilt from the results.
+                row = []
+                for word in results_by_line.get(line, []):
+                    row.extend([(' ', 0)] * (word.start_idx - len(row)))
+                    row.extend(make_row(word.expected, curses.color_pair(CORRECT_PAIR if word.correct else WRONG_PAIR)))
+                frame.append(row)
+                continue
+
+            row = make_row(layout.line_text(line))
+
+            for word in results_by_line.get(line, []):
+                pair = curses.color_pair(CORRECT_PAIR if word.correct else WRONG_PAIR)
+                for x in range(word.start_idx, word.end_idx):
+                    row[x] = (row[x][0], pair)
+
+            if line == curr_line:
+                for i, state in enumerate(self.letter_states):
+                    x = curr_column + i
+                    pair = (HIGHLIGHT_PAIR if state is None else CORRECT_PAIR if state else WRONG_PAIR)
+                    row[x] = (row[x][0], curses.color_pair(pair) | curses.A_UNDERLINE)
+
+            frame.append(row)
+
+        frame.append([])
+        frame.append(make_row(f'> {self.user_input}', curses.A_BOLD))
+
+        return frame
+
+    def run(self):
+
+        while True:
+
+            self.screen.draw(self.build_frame())
+
+            try:
+                key = self.window.get_wch()
+            except curses.error:
+                # No key pressed within POLL_MS.
+                key = None
+
+            if key == curses.KEY_RESIZE:
+                self.screen.invalidate()
+
+            elif key is not None and not self.handle_key(key):
+                return
+
+            self.tick()
+
+
+def run(window, args):
+
+    curses.curs_set(0)
+    # Esc quits, without the default one second wait for an escape sequence.
+    curses.set_escdelay(25)
+    curses.use_default_colors()
+    curses.init_pair(CORRECT_PAIR, curses.COLOR_GREEN, -1)
+    curses.init_pair(WRONG_PAIR, curses.COLOR_RED, -1)
+    curses.init_pair(HIGHLIGHT_PAIR, curses.COLOR_CYAN, -1)
+    curses.init_pair(WARNING_PAIR, curses.COLOR_YELLOW, -1)
+
+    window.timeout(POLL_MS)
+
+    TerminalApp(window, args.language, args.duration or None).run()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Typing speed test in the terminal.')
+    parser.add_argument('--language', default='English', choices=list(files.keys()))
+    parser.add_argument('--duration', type=int, default=60, help='test length in seconds, 0 for endless (default: 60)')
+    args = parser.parse_args(argv)
+
+    locale.setlocale(locale.LC_ALL, '')
+    curses.wrapper(run, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
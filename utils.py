@@ -1,8 +1,13 @@
 import os
 import sys
+import mmap
+import time
+import struct
 import random
+import threading
 import webbrowser
-from tkinter import messagebox
+from collections import OrderedDict
+from collections.abc import Sequence
 
 files = {
     'English': 'common_words_en.txt',
@@ -11,9 +16,31 @@ files = {
     'Français': 'common_words_fr.txt'
 }
 
+# Set by bench_startup.py to the time.time() the app was launched at,
+# makes it report its first frame and quit.
+STARTUP_PROBE_ENV = 'TYPING_TEST_STARTUP_PROBE'
+# Set to anything but 0 or false to start with profiling on, see profiling.py.
+PROFILE_ENV = 'TYPING_TEST_PROFILE'
+
+# How many languages are kept in memory at once.
+MAX_CACHED_CORPORA = 2
+
+# How far, in letters, alignments may drift from the diagonal, see align_word.
+ALIGNMENT_BAND = 2
+# Alignment moves.
+MATCH, SUBSTITUTION, INSERTION, DELETION = range(4)
+
+# Compiled word list format, see compile_words.py.
+WORD_LIST_MAGIC = b'TSTW'
+WORD_LIST_HEADER = struct.Struct('<4sII')
+WORD_LIST_OFFSET = struct.Struct('<I')
+
 
 def about_messagebox():
 
+    # Imported here so the terminal front-end and the command line tools don't load Tk.
+    from tkinter import messagebox
+
     open_git = messagebox.askyesno(title='About', message="""Created by Ramon Saviato.
 
 
@@ -27,30 +54,328 @@ View profile on GitHub?""")
         open_github()
 
 
-def get_random_words(num: int, language: str):
+class CorpusCache:
+
+    # Keeps the word lists of the most recently used languages in memory,
+    # so that only the first reset for a language has to read its file.
+
+    def __init__(self, max_size=MAX_CACHED_CORPORA):
+
+        self.max_size = max_size
+        self.corpora = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+
+        # Corpora may be loaded from a background thread.
+        self.lock = threading.Lock()
+
+    def get(self, language: str):
+
+        with self.lock:
+
+            corpus = self.corpora.get(language)
+
+            if corpus is not None:
+                self.hits += 1
+                # Mark as most recently used.
+                self.corpora.move_to_end(language)
+                return corpus
+
+            self.misses += 1
+
+            start = time.perf_counter()
+            corpus = load_corpus(language)
+            self.load_time += time.perf_counter() - start
+
+            self.corpora[language] = corpus
+
+            # Evict the least recently used languages.
+            while len(self.corpora) > self.max_size:
+                self.corpora.popitem(last=False)
+
+            return corpus
+
+    def clear(self):
+
+        with self.lock:
+            self.corpora.clear()
+
+    def stats(self):
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'load_time': self.load_time,
+                'cached': list(self.corpora.keys()),
+            }
+
+
+class MappedWordList(Sequence):
+
+    # A compiled word list, memory-mapped so that only the words actually
+    # picked are ever decoded. Being a Sequence, random.sample() selects
+    # from it by index without materialising the whole list.
+
+    def __init__(self, filename):
+
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = WORD_LIST_HEADER.unpack_from(self.data, 0)
+
+        if magic != WORD_LIST_MAGIC or version != 1:
+            self.data.close()
+            raise ValueError(f'{filename} is not a compiled word list')
+
+        self.count = count
+        self.offsets_start = WORD_LIST_HEADER.size
+        self.blob_start = self.offsets_start + (count + 1) * WORD_LIST_OFFSET.size
+
+    def __len__(self):
+
+        return self.count
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+
+        if index < 0:
+            index += self.count
+
+        if not 0 <= index < self.count:
+            raise IndexError('word index out of range')
+
+        position = self.offsets_start + index * WORD_LIST_OFFSET.size
+        start, = WORD_LIST_OFFSET.unpack_from(self.data, position)
+        end, = WORD_LIST_OFFSET.unpack_from(self.data, position + WORD_LIST_OFFSET.size)
+
+        return self.data[self.blob_start + start:self.blob_start + end].decode('utf-8')
+
+
+def load_corpus(language: str):
 
     file = files[language]
 
-    with open(get_true_filename(file), encoding='utf-8') as f:
-        all_words = [word.strip() for word in f.readlines()]
+    compiled = get_true_filename(get_compiled_filename(file))
+    source = get_true_filename(file)
+
+    # Prefer the compiled list, unless the text file was edited after compiling it.
+    if os.path.exists(compiled) and (not os.path.exists(source)
+                                     or os.path.getmtime(compiled) >= os.path.getmtime(source)):
+        return MappedWordList(compiled)
+
+    with open(source, encoding='utf-8') as f:
+        # A tuple is smaller than a list and can't be mutated by callers.
+        return tuple(word for word in (line.strip() for line in f) if word)
+
+
+corpus_cache = CorpusCache()
+
+
+def get_random_words(num: int, language: str, seed=None):
+
+    # The same seed always gives the same words.
+    rng = random if seed is None else random.Random(seed)
+
+    return rng.sample(corpus_cache.get(language), num)
+
 
-    return random.sample(all_words, num)
+def generate_random_words(language: str, batch_size=200):
 
+    # Endless stream of random words, sampled a batch at a time as they're consumed.
 
-def get_word_differences(expected, actual):
+    while True:
+        corpus = corpus_cache.get(language)
+        # Sampling nothing forever would hang whoever is drawing the words.
+        if not len(corpus):
+            raise ValueError(f'The {language} word list is empty')
+        yield from random.sample(corpus, min(batch_size, len(corpus)))
 
-    def compare_letter(a, b):
-        return a != b
 
-    return list(map(compare_letter, expected, actual))
+# Alignment tables, reused between calls and grown as needed.
+alignment_costs = []
+alignment_moves = []
 
 
-def get_correct_typed_characters(expected, actual):
+def align_word(expected, actual, partial=False, band=ALIGNMENT_BAND):
 
-    differences = get_word_differences(expected, actual)
-    differences = filter(lambda elem: not elem, differences)
+    # Aligns what the user typed with the expected word (edit distance), so a missed or extra
+    # letter only counts once instead of throwing off every letter after it.
+    # With partial, actual is matched against the best prefix of expected, as while typing.
+    #
+    # Only cells within `band` of the diagonal are computed, so the cost stays small and linear
+    # in the word length. Returns the state of every expected letter (see get_letter_states),
+    # the counts of matches, substitutions, insertions and deletions, and the position of the
+    # expected letter the last typed letter was aligned with, None for an extra letter.
 
-    return len(list(differences))
+    n = len(expected)
+    m = len(actual)
+
+    # Most of the time the user is typing the word right.
+    if expected.startswith(actual) and (partial or m == n):
+        return [True] * m + [None] * (n - m), [m, 0, 0, 0], m - 1 if m else None
+
+    # The band must at least reach the cell the alignment ends in.
+    if m > n or not partial:
+        band = max(band, abs(m - n))
+
+    width = n + 1
+    size = (m + 1) * width
+    infinity = m + n + 1
+
+    costs = alignment_costs
+    moves = alignment_moves
+
+    if len(costs) < size:
+        costs.extend([0] * (size - len(costs)))
+        moves.extend([0] * (size - len(moves)))
+
+    # First row, expected letters skipped before typing anything.
+    for j in range(min(n, band) + 1):
+        costs[j] = j
+        moves[j] = DELETION
+    if band + 1 <= n:
+        costs[band + 1] = infinity
+
+    for i in range(1, m + 1):
+
+        row = i * width
+        previous = row - width
+        letter = actual[i - 1]
+
+        lo = max(0, i - band)
+        hi = min(n, i + band)
+
+        if lo == 0:
+            costs[row] = i
+            moves[row] = INSERTION
+            lo = 1
+        else:
+            # Outside the band.
+            costs[row + lo - 1] = infinity
+
+        for j in range(lo, hi + 1):
+
+            if expected[j - 1] == letter:
+                cost = costs[previous + j - 1]
+                move = MATCH
+            else:
+                cost = costs[previous + j - 1] + 1
+                move = SUBSTITUTION
+
+            insertion = costs[previous + j] + 1
+            if insertion < cost:
+                cost = insertion
+                move = INSERTION
+
+            deletion = costs[row + j - 1] + 1
+            if deletion < cost:
+                cost = deletion
+                move = DELETION
+
+            costs[row + j] = cost
+            moves[row + j] = move
+
+        if hi + 1 <= n:
+            costs[row + hi + 1] = infinity
+
+    row = m * width
+
+    if partial:
+        # The best prefix, closest to the typed length on ties.
+        lo = max(0, m - band)
+        hi = min(n, m + band)
+        end = min(range(lo, hi + 1), key=lambda j: (costs[row + j], abs(j - m)))
+    else:
+        end = n
+
+    states = [None] * n
+    counts = [0, 0, 0, 0]
+    last = None
+
+    i = m
+    j = end
+
+    while i > 0 or j > 0:
+
+        move = moves[i * width + j] if i > 0 else DELETION
+        counts[move] += 1
+
+        if i == m and (move == MATCH or move == SUBSTITUTION):
+            last = j - 1
+
+        if move == MATCH:
+            # Unless flagged by an extra letter after it.
+            if states[j - 1] is None:
+                states[j - 1] = True
+            i -= 1
+            j -= 1
+
+        elif move == SUBSTITUTION:
+            states[j - 1] = False
+            i -= 1
+            j -= 1
+
+        elif move == DELETION:
+            states[j - 1] = False
+            j -= 1
+
+        else:
+            # An extra letter, flagged on the letter it follows (or precedes, at the start).
+            if j > 0:
+                states[j - 1] = False
+            elif n > 0:
+                states[0] = False
+            i -= 1
+
+    return states, counts, last
+
+
+def get_letter_states(expected, actual):
+
+    # One state per letter of the expected word:
+    # True if typed correctly, False if typed wrong, None if not typed yet.
+
+    return align_word(expected, actual, partial=True)[0]
+
+
+def get_changed_runs(old_states, new_states):
+
+    # Compares two lists of letter states and groups the letters that changed
+    # into runs sharing the same new state, so each run can be retagged at once.
+    # Yields (start, end, states the run had before, new state).
+
+    run_start = None
+    run_state = None
+    run_old_states = set()
+
+    for i, (old, new) in enumerate(zip(old_states, new_states)):
+
+        if old == new or (run_start is not None and new != run_state):
+            if run_start is not None:
+                yield run_start, i, run_old_states, run_state
+                run_start = None
+
+        if old != new and run_start is None:
+            run_start = i
+            run_state = new
+            run_old_states = set()
+
+        if run_start is not None:
+            run_old_states.add(old)
+
+    if run_start is not None:
+        yield run_start, min(len(old_states), len(new_states)), run_old_states, run_state
+
+
+def is_env_flag_set(name):
+
+    # Unset, empty, 0, false and no all mean off.
+    return os.environ.get(name, '').strip().lower() not in ('', '0', 'false', 'no', 'off')
 
 
 def open_github():
@@ -58,6 +383,17 @@ def open_github():
     webbrowser.open('https://github.com/BerettaSM')
 
 
+def get_data_dir():
+
+    # Where the app keeps its history and caches.
+    return os.path.join(os.path.expanduser('~'), '.typing-speed-test')
+
+
+def get_compiled_filename(filename):
+
+    return os.path.splitext(filename)[0] + '.bin'
+
+
 def get_true_filename(filename):
 
     try: